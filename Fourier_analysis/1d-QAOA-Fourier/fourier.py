@@ -0,0 +1,114 @@
+"""
+Fourier
+=======
+
+Exact Fourier coefficients of expectation values <P>(x) of a feature map with 1d inputs.
+
+``max_frequency()`` returns the largest frequency of ``embedding_circuit()``, its number of RX(x) gates
+``sample_points()`` returns the 2K+1 equidistant inputs that determine a spectrum up to frequency K
+``coefficients()`` returns the Fourier coefficients of <P>(x) for every observable
+``embedding_coefficients()`` returns the coefficients of n_x, n_y and n_z of ``embedding_circuit()``
+``evaluate()`` evaluates the Fourier series at given inputs
+
+If x enters a circuit through K gates exp(-i x G / 2) with Pauli generators G, the
+expectation value of any observable is a trigonometric polynomial
+
+    <P>(x) = sum_{w=-K..K} c_w exp(i w x),
+
+so it is fixed by its values at the 2K+1 points x_k = 2 pi k / (2K+1), and the
+coefficients are the discrete Fourier transform of these values. All points, and
+optionally many weight sets, are evaluated in one broadcasted execution of the circuit,
+instead of one circuit per grid point and Pauli as in ``1D-data-qaoa-fourier.ipynb``.
+"""
+import numpy as np
+import pennylane as qml
+from embeddings_circuit import embedding_circuit
+
+
+def max_frequency(weights, n_wires=1):
+    """
+    Number of encoding gates RX(x) of ``embedding_circuit()``, which bounds its frequencies.
+
+    :param weights: weights of shape (n_layers, n_wires)
+    :param n_wires: number of wires
+    """
+    return (len(weights) + 1) * n_wires
+
+
+def sample_points(K):
+    """Inputs 2 pi k / (2K+1), k = 0..2K, of shape (2K+1,)."""
+    return 2 * np.pi * np.arange(2 * K + 1) / (2 * K + 1)
+
+
+def _paulis(n_wires):
+    return [P(w) for w in range(n_wires) for P in (qml.PauliX, qml.PauliY, qml.PauliZ)]
+
+
+def coefficients(featmap, weights, n_wires, K, observables=None, batched=False):
+    """
+    Computes the Fourier coefficients of <P>(x) for every observable P.
+
+    With batched=True, weights has a leading axis of P weight sets. The axis is moved to
+    the end, so that indexing the weights as in ``embedding_circuit()`` hands every gate a
+    broadcasted parameter, and all weight sets are evaluated in the same execution.
+
+    :param featmap: feature map with signature featmap(x, weights, wires)
+    :param weights: weights of the feature map, with a leading axis of size P if batched
+    :param n_wires: number of wires the feature map acts on
+    :param K: largest frequency, at least the number of encoding gates
+    :param observables: list of observables, by default X, Y and Z on every wire
+    :param batched: whether weights has a leading axis of weight sets
+    :return: complex array of shape (n_observables, 2K+1), or (P, n_observables, 2K+1) if
+        batched, with the coefficients of the frequencies -K..K
+    """
+    observables = _paulis(n_wires) if observables is None else observables
+    x = sample_points(K)
+    n_points = len(x)
+
+    weights = np.asarray(weights, dtype=float)
+    if batched:
+        n_sets = len(weights)
+        # Broadcast over (weight set, point), flattened
+        weights = np.repeat(np.moveaxis(weights, 0, -1), n_points, axis=-1)
+        x = np.tile(x, n_sets)
+
+    dev = qml.device('default.qubit', wires=n_wires)
+
+    @qml.qnode(dev)
+    def circuit(x, weights):
+        featmap(x, weights, range(n_wires))
+        return [qml.expval(P) for P in observables]
+
+    values = np.array(circuit(x, weights)).reshape(len(observables), -1, n_points)
+    c = np.fft.fftshift(np.fft.fft(values, axis=-1), axes=-1) / n_points
+    c = np.moveaxis(c, 1, 0)
+    return c if batched else c[0]
+
+
+def embedding_coefficients(weights, n_wires=1, batched=False):
+    """
+    Computes the Fourier coefficients of the Bloch components n_x, n_y and n_z of every
+    wire of ``embedding_circuit()``.
+
+    :param weights: weights of shape (n_layers, n_wires), or (P, n_layers, n_wires) if batched
+    :param n_wires: number of wires
+    :param batched: whether weights has a leading axis of weight sets
+    :return: complex array of shape (3 * n_wires, 2K+1), or (P, 3 * n_wires, 2K+1) if batched,
+        with K = ``max_frequency()``
+    """
+    K = max_frequency(weights[0] if batched else weights, n_wires)
+    return coefficients(embedding_circuit, weights, n_wires, K, batched=batched)
+
+
+def evaluate(coefficients, x):
+    """
+    Evaluates the Fourier series with the coefficients of frequencies -K..K at the inputs x.
+
+    :param coefficients: complex array of shape (..., 2K+1)
+    :param x: array of inputs of shape (M,)
+    :return: real array of shape (..., M)
+    """
+    coefficients = np.asarray(coefficients)
+    K = (coefficients.shape[-1] - 1) // 2
+    phases = np.exp(1j * np.outer(np.arange(-K, K + 1), np.asarray(x, dtype=float)))
+    return np.real(coefficients @ phases)
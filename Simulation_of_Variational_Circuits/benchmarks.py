@@ -0,0 +1,433 @@
+"""
+Benchmarks
+==========
+
+Timings of the feature maps, the classifier and the training step, with a baseline file
+to detect performance regressions.
+
+``featmap_cases()`` enumerates the feature maps of ``featuremaps`` across wire and layer counts
+``embedding_cases()`` enumerates the ``embedding_circuit`` variants of the other folders
+``bench_embeddings()`` times the embedding of a block of inputs for each case
+``bench_predict()`` times ``fidelity.predict()`` per implementation and training-set size
+``bench_training()`` times one training step with the Hilbert-Schmidt and the overlap cost
+``run()`` runs the suites and returns the results with a description of the machine
+``save()`` and ``load()`` write and read a results file
+``compare()`` lists the benchmarks that got slower than in a baseline
+``speedups()`` lists how much faster every benchmark is than its PennyLane reference
+
+Every workload also has reference cases, named 'reference/<benchmark name>', that run
+the original PennyLane path on a small size: one QNode execution per input returning
+its state, and ``qml.grad`` through these QNodes for the training step. They are timed
+like the other benchmarks, so that a stored baseline shows whether the statevector
+engine still beats the original implementation, and not only whether it got slower.
+
+Every benchmark is run once to warm up caches (compiled tapes, loaded models) and then
+timed repeats times; the results hold the median, minimum and mean duration in seconds.
+The counters of ``instrumentation`` of one run are stored alongside, so that scaling
+claims can be checked in numbers of circuits and gates as well as in seconds.
+
+Usage::
+
+    python benchmarks.py --save baseline.json
+    python benchmarks.py --compare baseline.json --tolerance 1.3
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from functools import partial
+
+import numpy as np
+import pennylane as qml
+from pennylane import numpy as pnp
+import fidelity
+import generators
+import instrumentation
+import models
+from featuremaps import HVA_XXZ
+from statevector import feature_states
+from sweep import CIRCUITS, supported, build_featmap, initial_pars
+from training import COSTS, RMSProp, sample_pairs
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# Name -> file of the embedding_circuit variants, relative to the repository root
+EMBEDDINGS = {
+    'fourier_1d': os.path.join('Fourier_analysis', '1d-QAOA-Fourier', 'embeddings_circuit.py'),
+    'risk_2d': os.path.join('risk_function', '2d_data', 'embeddings_circuit.py'),
+    'random': os.path.join('random_embedding_circuits', 'two_wires_random_unitary_embeddings.py'),
+}
+
+# Feature map of the predict benchmark
+PREDICT_FEATMAP = {'name': 'qaoa', 'kwargs': {'n_layers': 2, 'circuit_ID': 1}}
+
+SUITES = ('featmaps', 'embeddings', 'predict', 'training')
+
+
+def time_call(function, repeats=5):
+    """
+    Times a function without arguments after one warm-up call.
+
+    :param function: function to time
+    :param repeats: number of timed calls
+    :return: dict with the 'median', 'min' and 'mean' duration in seconds, the number of
+        'repeats' and the instrumentation 'counters' of one call
+    """
+    with instrumentation.recording() as run:
+        function()
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return {'median': float(np.median(durations)),
+            'min': float(np.min(durations)),
+            'mean': float(np.mean(durations)),
+            'repeats': repeats,
+            'counters': run['counters']}
+
+
+def _pennylane_states(featmap, pars, X, n_wires):
+    """Embeds the inputs one at a time with a PennyLane QNode, as before the statevector engine."""
+    dev = qml.device('default.qubit', wires=n_wires)
+
+    @qml.qnode(dev)
+    def circuit(weights, x):
+        featmap(weights, x, range(n_wires))
+        return qml.state()
+
+    return qml.math.stack([circuit(pars, x) for x in X])
+
+
+def _pennylane_predict(x_new, path):
+    """Margin overlap_A - overlap_B of a model from PennyLane states, as the original 'exact'."""
+    model = models.load(path)
+    n_A = len(model.samples(1))
+    X = np.concatenate([model.samples(1), model.samples(-1), [x_new]])
+    states = _pennylane_states(model.featmap, np.asarray(model.pars), X, model.n_wires)
+    overlaps = np.abs(states[:-1] @ states[-1].conj()) ** 2
+    return np.mean(overlaps[:n_A]) - np.mean(overlaps[n_A:])
+
+
+def _pennylane_cost_and_grad(cost, featmap, pars, A, B, n_wires):
+    """Cost and gradient with ``qml.grad`` through PennyLane states, as before the statevector engine."""
+    formula = COSTS[cost][0]
+
+    def cost_fn(weights):
+        S_A = _pennylane_states(featmap, weights, A, n_wires)
+        S_B = _pennylane_states(featmap, weights, B, n_wires)
+        tr_rr = pnp.mean(pnp.abs(pnp.dot(pnp.conj(S_A), S_A.T)) ** 2)
+        tr_ss = pnp.mean(pnp.abs(pnp.dot(pnp.conj(S_B), S_B.T)) ** 2)
+        tr_rs = pnp.mean(pnp.abs(pnp.dot(pnp.conj(S_A), S_B.T)) ** 2)
+        return formula(tr_rr, tr_ss, tr_rs)
+
+    weights = pnp.array(pars, requires_grad=True)
+    return cost_fn(weights), qml.grad(cost_fn)(weights)
+
+
+def _pars_HVA_XXZ(n_wires, n_layers):
+    if n_wires == 1:
+        return 0.001 * np.ones(n_layers)
+    if n_wires == 2:
+        return 0.001 * np.ones(3 * n_layers)
+    return 0.001 * np.ones(2 * n_wires * n_layers)
+
+
+def featmap_cases(wires=(1, 2, 3, 4), layers=(1, 2, 4), data_dim=1):
+    """
+    Enumerates the feature maps of ``featuremaps`` for all supported sizes: the circuit IDs
+    of ``sweep.CIRCUITS`` and HVA_XXZ.
+
+    :return: list of tuples (name, featmap, pars, n_wires, data_dim)
+    """
+    np.random.seed(0)
+    cases = []
+    for circuit_ID, (featmap, kwargs) in CIRCUITS.items():
+        label = '-'.join([featmap.__name__] + [str(v) for v in kwargs.values()])
+        for n_layers in layers:
+            for n_wires in wires:
+                if supported(circuit_ID, n_layers, n_wires, data_dim):
+                    cases.append(('featmap/{}/L{}/W{}'.format(label, n_layers, n_wires),
+                                  build_featmap(circuit_ID, n_layers),
+                                  np.array(initial_pars(circuit_ID, n_layers, n_wires, data_dim), dtype=float),
+                                  n_wires, data_dim))
+    for n_layers in layers:
+        for n_wires in wires:
+            cases.append(('featmap/HVA_XXZ/L{}/W{}'.format(n_layers, n_wires),
+                          partial(HVA_XXZ, n_layers=n_layers), _pars_HVA_XXZ(n_wires, n_layers),
+                          n_wires, data_dim))
+    return cases
+
+
+def _import(name, path):
+    spec = importlib.util.spec_from_file_location('_embedding_' + name, os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def embedding_cases(wires=(1, 2, 3, 4), layers=(1, 2, 4)):
+    """
+    Enumerates the ``embedding_circuit`` variants of the other folders, with weights of
+    shape (n_layers, n_wires), wrapped to the signature featmap(weights, x, wires).
+
+    :return: list of tuples (name, featmap, pars, n_wires, data_dim), where data_dim is
+        None for variants with scalar input
+    """
+    rng = np.random.default_rng(0)
+    cases = []
+    for name, path in EMBEDDINGS.items():
+        module = _import(name, path)
+        for n_layers in layers:
+            for n_wires in wires:
+                if name == 'random':
+                    codes = module.random_gate_codes(n_wires, n_layers, rng=rng)
+                    circuit = partial(module.random_embedding_circuit, gate_sequence=codes)
+                else:
+                    circuit = module.embedding_circuit
+
+                def featmap(weights, x, wires, circuit=circuit):
+                    return circuit(x, weights, wires)
+
+                cases.append(('embedding/{}/L{}/W{}'.format(name, n_layers, n_wires), featmap,
+                              rng.uniform(0, 2 * np.pi, size=(n_layers, n_wires)), n_wires,
+                              2 if name == 'risk_2d' else None))
+    return cases
+
+
+def bench_embeddings(cases, n_inputs=256, n_reference=16, repeats=5):
+    """
+    Times ``statevector.feature_states()`` on a block of inputs for every case, and the
+    PennyLane reference on a smaller block.
+
+    :param cases: list of tuples (name, featmap, pars, n_wires, data_dim)
+    :param n_inputs: number of inputs per block
+    :param n_reference: number of inputs per block of the reference, 0 to skip it
+    :param repeats: number of timed calls
+    :return: dict of benchmark name -> timing, see ``time_call()``
+    """
+    rng = np.random.default_rng(0)
+    results = {}
+    for name, featmap, pars, n_wires, data_dim in cases:
+        shape = (n_inputs,) if data_dim is None else (n_inputs, data_dim)
+        X = rng.uniform(-np.pi, np.pi, size=shape)
+        results[name] = time_call(lambda: feature_states(featmap, pars, X, n_wires), repeats)
+        results[name]['n_inputs'] = n_inputs
+        if n_reference:
+            X_reference = X[:n_reference]
+            reference = 'reference/' + name
+            results[reference] = time_call(lambda: _pennylane_states(featmap, pars, X_reference, n_wires),
+                                           repeats)
+            results[reference]['n_inputs'] = len(X_reference)
+    return results
+
+
+def bench_predict(sizes=(16, 64, 256, 1024), implementations=('exact', 'fast', 'compiled', 'circuit'),
+                  circuit_sizes=(16, 64), n_wires=2, repeats=5):
+    """
+    Times one ``fidelity.predict()`` for every implementation and training-set size, with
+    the feature map ``PREDICT_FEATMAP`` saved as a model directory. The PennyLane
+    reference of 'exact' is timed for the sizes of 'circuit'.
+
+    :param sizes: numbers of training inputs
+    :param implementations: implementations of ``fidelity.predict()``
+    :param circuit_sizes: numbers of training inputs for the slow 'circuit' implementation and
+        the reference
+    :param n_wires: number of wires of the feature map
+    :param repeats: number of timed calls
+    :return: dict of benchmark name -> timing, see ``time_call()``
+    """
+    pars = np.array(initial_pars(1, PREDICT_FEATMAP['kwargs']['n_layers'], n_wires, n_wires), dtype=float)
+    x_new = np.full(n_wires, 0.3)
+    directory = tempfile.mkdtemp()
+    results = {}
+    try:
+        for size in sizes:
+            X, Y = generators.separable(size, dim=n_wires, rng=size)
+            path = os.path.join(directory, str(size))
+            models.save(path, PREDICT_FEATMAP, n_wires, pars, X, Y)
+            for implementation in implementations:
+                if implementation == 'circuit' and size not in circuit_sizes:
+                    continue
+                name = 'predict/{}/N{}'.format(implementation, size)
+                results[name] = time_call(
+                    lambda: fidelity.predict(x_new, path, implementation=implementation), repeats)
+                results[name]['n_train'] = size
+            if size in circuit_sizes:
+                name = 'reference/predict/exact/N{}'.format(size)
+                results[name] = time_call(lambda: _pennylane_predict(x_new, path), repeats)
+                results[name]['n_train'] = size
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def bench_training(wires=(1, 2, 4), batch_sizes=(1, 16), costs=tuple(COSTS), n_layers=2, repeats=5,
+                   reference_batch_sizes=(1,)):
+    """
+    Times one training step, the cost and gradient of a batch and an RMSProp update, for
+    the qaoa feature map on the 1d separable dataset, and the same step with the
+    PennyLane reference of the cost and gradient.
+
+    :param wires: numbers of wires
+    :param batch_sizes: numbers of inputs of each class per step
+    :param reference_batch_sizes: batch sizes for which the reference is timed
+    :param costs: names of the costs, see ``training.COSTS``
+    :param n_layers: number of layers
+    :param repeats: number of timed calls
+    :return: dict of benchmark name -> timing, see ``time_call()``
+    """
+    X, Y = generators.separable(200, dim=1, rng=0)
+    A, B = X[Y == -1], X[Y == 1]
+    rng = np.random.default_rng(0)
+    results = {}
+    for n_wires in wires:
+        featmap = build_featmap(1, n_layers)
+        pars = np.array(initial_pars(1, n_layers, n_wires, 1), dtype=float)
+        for batch_size in batch_sizes:
+            selectA, selectB = sample_pairs(rng, len(A), len(B), batch_size)
+            for cost in costs:
+                cost_and_grad = COSTS[cost][1]
+                optimizer = RMSProp()
+
+                def step():
+                    _, grad = cost_and_grad(featmap, pars, A[selectA], B[selectB], n_wires)
+                    return optimizer.step(pars, grad)
+
+                name = 'train_step/{}/W{}/B{}'.format(cost, n_wires, batch_size)
+                results[name] = time_call(step, repeats)
+
+                if batch_size in reference_batch_sizes:
+                    def reference_step(cost=cost, optimizer=optimizer):
+                        _, grad = _pennylane_cost_and_grad(cost, featmap, pars, A[selectA], B[selectB], n_wires)
+                        return optimizer.step(pars, grad)
+
+                    results['reference/' + name] = time_call(reference_step, repeats)
+    return results
+
+
+def machine():
+    """Description of the machine and the versions of the libraries."""
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pennylane': qml.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count()}
+
+
+def run(suites=SUITES, quick=False, repeats=5, verbose=True):
+    """
+    Runs benchmark suites.
+
+    :param suites: names of the suites, of ``SUITES``
+    :param quick: if True, use fewer sizes
+    :param repeats: number of timed calls per benchmark
+    :param verbose: if True, print every result
+    :return: dict with the 'machine', the 'time' and the 'results', benchmark name -> timing
+    """
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        raise ValueError("Unknown suites {}, use some of {}.".format(sorted(unknown), SUITES))
+    wires, layers = ((1, 2), (1, 2)) if quick else ((1, 2, 3, 4), (1, 2, 4))
+
+    results = {}
+    for suite in suites:
+        if suite == 'featmaps':
+            suite_results = bench_embeddings(featmap_cases(wires, layers), repeats=repeats)
+        elif suite == 'embeddings':
+            suite_results = bench_embeddings(embedding_cases(wires, layers), repeats=repeats)
+        elif suite == 'predict':
+            suite_results = bench_predict(sizes=(16, 64) if quick else (16, 64, 256, 1024),
+                                          circuit_sizes=(16,) if quick else (16, 64), repeats=repeats)
+        else:
+            suite_results = bench_training(wires=wires, repeats=repeats)
+        if verbose:
+            for name, result in suite_results.items():
+                print("{:50s} {:10.6f} s".format(name, result['median']))
+        results.update(suite_results)
+    return {'machine': machine(), 'time': time.time(), 'results': results}
+
+
+def save(results, path):
+    """Writes the results of ``run()`` to a JSON file."""
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load(path):
+    """Reads results written by ``save()``."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance=1.3):
+    """
+    Compares the median durations of results with a baseline.
+
+    :param results: results of ``run()``
+    :param baseline: results of an earlier ``run()``
+    :param tolerance: largest accepted ratio of the new to the baseline median
+    :return: list of tuples (name, baseline median, new median, ratio) of the benchmarks
+        slower than tolerance times the baseline, slowest first; the reference cases are
+        not compared, see ``speedups()``
+    """
+    regressions = []
+    for name, result in results['results'].items():
+        if name in baseline['results'] and not name.startswith('reference/'):
+            old = baseline['results'][name]['median']
+            ratio = result['median'] / old if old > 0 else np.inf
+            if ratio > tolerance:
+                regressions.append((name, old, result['median'], ratio))
+    return sorted(regressions, key=lambda r: -r[3])
+
+
+def speedups(results):
+    """
+    Compares every benchmark with a reference case to its reference, per input for the
+    embedding benchmarks.
+
+    :param results: results of ``run()``
+    :return: list of tuples (name, reference median, median, speedup), where the speedup is
+        the ratio of the reference to the benchmark duration
+    """
+    results = results['results']
+    rows = []
+    for reference, timing in results.items():
+        if not reference.startswith('reference/'):
+            continue
+        name = reference[len('reference/'):]
+        if name not in results:
+            continue
+        old = timing['median'] / timing.get('n_inputs', 1)
+        new = results[name]['median'] / results[name].get('n_inputs', 1)
+        rows.append((name, old, new, old / new if new > 0 else np.inf))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time feature maps, predictions and training steps.")
+    parser.add_argument('--suites', nargs='+', default=list(SUITES), choices=SUITES)
+    parser.add_argument('--quick', action='store_true', help="use fewer sizes")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--save', help="write the results to this file")
+    parser.add_argument('--compare', help="baseline file to compare with")
+    parser.add_argument('--tolerance', type=float, default=1.3)
+    args = parser.parse_args()
+
+    results = run(args.suites, quick=args.quick, repeats=args.repeats)
+    for name, old, new, speedup in speedups(results):
+        print("Speedup {}: {:.6f} s -> {:.6f} s ({:.1f}x)".format(name, old, new, speedup))
+    if args.save:
+        save(results, args.save)
+    if args.compare:
+        regressions = compare(results, load(args.compare), args.tolerance)
+        for name, old, new, ratio in regressions:
+            print("Regression {}: {:.6f} s -> {:.6f} s ({:.2f}x)".format(name, old, new, ratio))
+        sys.exit(1 if regressions else 0)
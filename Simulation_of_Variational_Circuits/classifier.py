@@ -0,0 +1,231 @@
+"""
+Online classifier
+=================
+
+Fidelity classifier whose training set can change after it was built.
+
+``OnlineClassifier`` keeps running sums of the embedded training states of both classes
+``OnlineClassifier.from_featmap()`` builds a classifier from a trained feature map
+
+The classifier predicts the class whose mean overlap with the new input is larger,
+
+    overlap_A - overlap_B = <phi(x)| rho_A - rho_B |phi(x)>,
+
+with the mean density matrices rho_A and rho_B of the classes. In the 'density' mode
+these are kept as running sums of |phi><phi|, so that adding or removing a training
+point costs O(4^n) and a prediction is a single expectation value. In the 'states' mode,
+meant for more wires, the embedded states are kept in a growing array instead, and
+adding or removing a point costs O(2^n).
+
+As in ``fidelity.predict()``, the class labeled by +1 is 'A', the class labeled by -1 is 'B'.
+"""
+from collections import Counter
+
+import numpy as np
+from statevector import feature_states
+
+
+# Largest number of wires for which 'density' is the default mode
+_DENSITY_WIRES = 6
+
+
+def _key(x):
+    return np.asarray(x, dtype=float).tobytes()
+
+
+class OnlineClassifier:
+    """
+    Fidelity classifier with a training set that supports insertions and deletions.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param n_inp: number of wires the feature map acts on
+    :param mode: 'density' or 'states', by default 'density' for up to 6 wires
+    """
+
+    def __init__(self, featmap, pars, n_inp, mode=None):
+        if mode is None:
+            mode = 'density' if n_inp <= _DENSITY_WIRES else 'states'
+        if mode not in ('density', 'states'):
+            raise ValueError("Mode {} not recognized, use 'density' or 'states'.".format(mode))
+        self.featmap = featmap
+        self.pars = pars
+        self.n_inp = n_inp
+        self.mode = mode
+        dim = 2**n_inp
+        # Multiplicity of every stored input, per class
+        self._counts = {1: {}, -1: {}}
+        # Number of stored inputs, per class
+        self._totals = {1: 0, -1: 0}
+        if mode == 'density':
+            self._rho = {1: np.zeros((dim, dim), dtype=complex), -1: np.zeros((dim, dim), dtype=complex)}
+        else:
+            self._states = {1: np.empty((16, dim), dtype=complex), -1: np.empty((16, dim), dtype=complex)}
+            self._size = {1: 0, -1: 0}
+            # Slots of every stored input, and the input stored in every slot
+            self._slots = {1: {}, -1: {}}
+            self._keys = {1: [], -1: []}
+
+    @classmethod
+    def from_featmap(cls, path_to_featmap, mode=None):
+        """
+        Builds a classifier from a settings file or model directory, see ``fidelity.predict()``,
+        with the training samples as initial training set.
+        """
+        from fidelity import _load, _support_states
+        entry = _load(path_to_featmap)
+        classifier = cls(entry['featmap'], entry['pars'], entry['n_inp'], mode=mode)
+        A_states, B_states = _support_states(entry, entry['pars'])
+        classifier._insert(1, np.asarray(entry['A']), A_states)
+        classifier._insert(-1, np.asarray(entry['B']), B_states)
+        return classifier
+
+    def __len__(self):
+        return self.count(1) + self.count(-1)
+
+    def count(self, label):
+        """Number of training points with the given label."""
+        return self._totals[label]
+
+    def _require(self, label):
+        n = self._totals[label]
+        if n == 0:
+            raise ValueError("The training set has no points with label {}.".format(label))
+        return n
+
+    def _embed(self, X):
+        return feature_states(self.featmap, self.pars, np.asarray(X, dtype=float), self.n_inp)
+
+    @staticmethod
+    def _split(X, Y):
+        X = np.asarray(X, dtype=float)
+        X = X.reshape(len(X), -1)
+        Y = np.asarray(Y)
+        if len(X) != len(Y):
+            raise ValueError("Got {} inputs but {} labels.".format(len(X), len(Y)))
+        if not np.all((Y == 1) | (Y == -1)):
+            raise ValueError("Labels have to be 1 or -1.")
+        return [(label, X[Y == label]) for label in (1, -1) if np.any(Y == label)]
+
+    def _insert(self, label, X, states):
+        counts = self._counts[label]
+        for x in X:
+            key = _key(x)
+            counts[key] = counts.get(key, 0) + 1
+        self._totals[label] += len(X)
+
+        if self.mode == 'density':
+            self._rho[label] += states.T @ states.conj()
+            return
+
+        size = self._size[label]
+        buffer = self._states[label]
+        if size + len(states) > len(buffer):
+            grown = np.empty((max(2 * len(buffer), size + len(states)), buffer.shape[1]), dtype=complex)
+            grown[:size] = buffer[:size]
+            self._states[label] = buffer = grown
+        buffer[size:size + len(states)] = states
+        for slot, x in enumerate(X, start=size):
+            key = _key(x)
+            self._slots[label].setdefault(key, []).append(slot)
+            self._keys[label].append(key)
+        self._size[label] = size + len(states)
+
+    def add(self, X, Y):
+        """
+        Adds labeled points to the training set.
+
+        :param X: array of inputs of shape (N, d)
+        :param Y: array of labels 1 or -1 of shape (N,)
+        """
+        for label, X_label in self._split(X, Y):
+            self._insert(label, X_label, self._embed(X_label))
+
+    def remove(self, X, Y):
+        """
+        Removes labeled points from the training set. Every point has to be in the
+        training set with this label, as often as it occurs in X; otherwise a ValueError
+        is raised and the training set is left unchanged.
+
+        :param X: array of inputs of shape (N, d)
+        :param Y: array of labels 1 or -1 of shape (N,)
+        """
+        batches = self._split(X, Y)
+        # Check the whole batch, with multiplicities, before changing anything
+        for label, X_label in batches:
+            counts = self._counts[label]
+            for key, n in Counter(_key(x) for x in X_label).items():
+                if counts.get(key, 0) < n:
+                    x = np.frombuffer(key, dtype=float)
+                    raise ValueError("Input {} with label {} is in the training set {} times, cannot remove it {} times."
+                                     .format(x, label, counts.get(key, 0), n))
+
+        for label, X_label in batches:
+            counts = self._counts[label]
+            for x in X_label:
+                key = _key(x)
+                counts[key] -= 1
+                if counts[key] == 0:
+                    del counts[key]
+            self._totals[label] -= len(X_label)
+
+            if self.mode == 'density':
+                states = self._embed(X_label)
+                self._rho[label] -= states.T @ states.conj()
+            else:
+                for x in X_label:
+                    key = _key(x)
+                    slots = self._slots[label][key]
+                    slot = slots.pop()
+                    if not slots:
+                        del self._slots[label][key]
+                    self._delete_slot(label, slot)
+
+    def _delete_slot(self, label, slot):
+        """Removes the state in a slot by moving the last stored state into it."""
+        last = self._size[label] - 1
+        keys = self._keys[label]
+        if slot != last:
+            buffer = self._states[label]
+            buffer[slot] = buffer[last]
+            moved = keys[last]
+            slots = self._slots[label][moved]
+            slots[slots.index(last)] = slot
+            keys[slot] = moved
+        keys.pop()
+        self._size[label] = last
+
+    def density_matrix(self, label):
+        """Mean density matrix of the training points with the given label."""
+        n = self._require(label)
+        if self.mode == 'density':
+            return self._rho[label] / n
+        states = self._states[label][:self._size[label]]
+        return states.T @ states.conj() / n
+
+    def decision_function(self, X):
+        """
+        Computes overlap_A - overlap_B for every input.
+
+        :param X: array of inputs of shape (N, d)
+        :return: array of shape (N,)
+        """
+        n_A, n_B = self._require(1), self._require(-1)
+        phi = self._embed(np.asarray(X, dtype=float).reshape(len(X), -1))
+        if self.mode == 'density':
+            M = self._rho[1] / n_A - self._rho[-1] / n_B
+            return np.real(np.einsum('ni,ij,nj->n', phi.conj(), M, phi))
+        overlaps = []
+        for label in (1, -1):
+            states = self._states[label][:self._size[label]]
+            overlaps.append(np.mean(np.abs(phi.conj() @ states.T) ** 2, axis=1))
+        return overlaps[0] - overlaps[1]
+
+    def predict(self, X):
+        """
+        Predicts the labels of the inputs, 1 if overlap_A > overlap_B, -1 if smaller, 0 on ties.
+
+        :param X: array of inputs of shape (N, d)
+        :return: integer array of shape (N,)
+        """
+        return np.sign(self.decision_function(X)).astype(int)
@@ -0,0 +1,217 @@
+"""
+Cost functions
+==============
+
+Cost functions for training a feature map, evaluated on the n-qubit register only.
+
+``hs_cost()`` returns the Hilbert-Schmidt cost 1 - (-tr_rs + 0.5 * (tr_rr + tr_ss))
+``hs_cost_chunked()`` returns the Hilbert-Schmidt cost of a dataset streamed in chunks
+``hs_cost_and_grad()`` returns the Hilbert-Schmidt cost together with its gradient
+``overlap_cost()`` returns the overlap cost tr_rs
+``overlap_cost_and_grad()`` returns the overlap cost together with its gradient
+
+The gradients are exact. They are computed with the adjoint method from the embedded
+states of all samples: one forward and one backward sweep through the gates of the
+feature map, vectorized over the samples, instead of a parameter-shift evaluation of
+every pairwise SWAP test. For single-wire feature maps, the costs reduce to
+1 - |r_A - r_B|^2 / 4 and (1 + r_A.r_B) / 2 with the mean Bloch vectors r_A and r_B of
+the classes, which ``su2`` computes in closed form.
+"""
+import numpy as np
+import su2
+from kernels import class_overlaps, class_overlaps_chunked
+from statevector import feature_program, feature_states_vjp, weight_jacobian
+
+
+def _projection(states, onto):
+    """
+    Applies the unnormalised density matrix of the states in onto to every state,
+
+        out_i = \\sum_j |o_j><o_j|s_i>,
+
+    using either the density matrix or the pairwise overlaps, whichever is cheaper.
+    """
+    dim = states.shape[1]
+    if dim * (len(states) + len(onto)) < len(states) * len(onto):
+        rho = onto.T @ onto.conj()
+        return states @ rho.T
+    return (onto.conj() @ states.T).T @ onto
+
+
+def _single_wire_means(program, n_A, n_B):
+    """
+    Computes the mean Bloch vectors r_A and r_B of the classes of a single-wire program,
+    and their derivatives with respect to the gate angles, of shape (K, 3).
+    """
+    _, q, dq = su2.compose_with_derivatives(program, n_A + n_B)
+    r = su2.bloch_vectors(q)
+    dr = su2.bloch_derivatives(q, dq)
+    return (np.mean(r[:n_A], axis=0), np.mean(r[n_A:], axis=0),
+            np.mean(dr[:, :n_A], axis=1), np.mean(dr[:, n_A:], axis=1))
+
+
+def _single_wire_hs_cost_and_grad(program, jac, n_A, n_B):
+    """
+    Computes the Hilbert-Schmidt cost of a single-wire program and its gradient with
+    respect to the weights from the mean Bloch vectors of the classes.
+    """
+    r_A, r_B, dr_A, dr_B = _single_wire_means(program, n_A, n_B)
+    delta = r_A - r_B
+    cst = 1 - 0.25 * delta @ delta
+    grad_angles = -0.5 * (dr_A - dr_B) @ delta
+    return cst, jac.T @ grad_angles
+
+
+def _single_wire_overlap_cost_and_grad(program, jac, n_A, n_B):
+    """
+    Computes the overlap cost of a single-wire program and its gradient with respect to
+    the weights from the mean Bloch vectors of the classes.
+    """
+    r_A, r_B, dr_A, dr_B = _single_wire_means(program, n_A, n_B)
+    cst = 0.5 * (1 + r_A @ r_B)
+    grad_angles = 0.5 * (dr_A @ r_B + dr_B @ r_A)
+    return cst, jac.T @ grad_angles
+
+
+def _single_wire(single_wire_cost_and_grad, featmap, pars, X, n_A, n_B, n_inp):
+    """
+    Evaluates a single-wire cost in closed form if the feature map allows it.
+
+    :return: tuple of the cost and its gradient, or None
+    """
+    if n_inp != 1:
+        return None
+    program = feature_program(featmap, pars, X, n_inp)
+    if not su2.supports(program):
+        return None
+    jac = weight_jacobian(featmap, pars, X, n_inp)
+    cst, grad = single_wire_cost_and_grad(program, jac, n_A, n_B)
+    return cst, grad.reshape(np.shape(pars))
+
+
+def hs_cost(featmap, pars, A, B, n_inp):
+    """
+    Computes the Hilbert-Schmidt cost of a feature map.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param A: array of inputs of class A
+    :param B: array of inputs of class B
+    :param n_inp: number of wires the feature map acts on
+    :return: value of the cost, 0 for perfectly separated classes
+    """
+    tr_rr, tr_ss, tr_rs = class_overlaps(featmap, pars, A, B, n_inp)
+    distance = - tr_rs + 0.5 * (tr_ss + tr_rr)
+    return 1 - distance
+
+
+def hs_cost_chunked(featmap, pars, chunks, n_inp, label_A=-1):
+    """
+    Computes the Hilbert-Schmidt cost of a feature map on a dataset streamed in chunks.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param chunks: iterable of tuples (X_chunk, Y_chunk), for example from ``datasets.chunks()``
+    :param n_inp: number of wires the feature map acts on
+    :param label_A: label of class A, all other labels belong to class B
+    :return: value of the cost, 0 for perfectly separated classes
+    """
+    tr_rr, tr_ss, tr_rs = class_overlaps_chunked(featmap, pars, chunks, n_inp, label_A=label_A)
+    distance = - tr_rs + 0.5 * (tr_ss + tr_rr)
+    return 1 - distance
+
+
+def hs_cost_and_grad(featmap, pars, A, B, n_inp):
+    """
+    Computes the Hilbert-Schmidt cost of a feature map and its gradient with respect to
+    the weights.
+
+    With the states a_i of A and b_j of B, the derivative of the cost with respect to <a_i| is
+
+        1/(|A||B|) \\sum_j |b_j><b_j|a_i> - 1/|A|^2 \\sum_j |a_j><a_j|a_i>,
+
+    and likewise for <b_j|. These are pulled back to the weights with the adjoint method.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param A: array of inputs of class A
+    :param B: array of inputs of class B
+    :param n_inp: number of wires the feature map acts on
+    :return: tuple of the cost and its gradient, an array in the shape of pars
+    """
+    n_A, n_B = len(A), len(B)
+    X = np.concatenate([A, B])
+
+    closed_form = _single_wire(_single_wire_hs_cost_and_grad, featmap, pars, X, n_A, n_B, n_inp)
+    if closed_form is not None:
+        return closed_form
+
+    states, vjp = feature_states_vjp(featmap, pars, X, n_inp)
+    A_states = states[:n_A]
+    B_states = states[n_A:]
+
+    rho_A_on_A = _projection(A_states, A_states)
+    rho_B_on_A = _projection(A_states, B_states)
+    rho_A_on_B = _projection(B_states, A_states)
+    rho_B_on_B = _projection(B_states, B_states)
+
+    tr_rr = np.vdot(A_states, rho_A_on_A).real / n_A**2
+    tr_ss = np.vdot(B_states, rho_B_on_B).real / n_B**2
+    tr_rs = np.vdot(A_states, rho_B_on_A).real / (n_A * n_B)
+    cst = 1 - (- tr_rs + 0.5 * (tr_ss + tr_rr))
+
+    adjoints = np.concatenate([rho_B_on_A / (n_A * n_B) - rho_A_on_A / n_A**2,
+                               rho_A_on_B / (n_A * n_B) - rho_B_on_B / n_B**2])
+    return cst, vjp(adjoints)
+
+
+def overlap_cost(featmap, pars, A, B, n_inp):
+    """
+    Computes the overlap cost of a feature map, the mean inter-class overlap tr_rs.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param A: array of inputs of class A
+    :param B: array of inputs of class B
+    :param n_inp: number of wires the feature map acts on
+    :return: value of the cost, 0 for perfectly separated classes
+    """
+    _, _, tr_rs = class_overlaps(featmap, pars, A, B, n_inp)
+    return tr_rs
+
+
+def overlap_cost_and_grad(featmap, pars, A, B, n_inp):
+    """
+    Computes the overlap cost tr_rs of a feature map and its gradient with respect to
+    the weights.
+
+    With the states a_i of A and b_j of B, the derivative of the cost with respect to <a_i| is
+
+        1/(|A||B|) \\sum_j |b_j><b_j|a_i>,
+
+    and likewise for <b_j|. These are pulled back to the weights with the adjoint method.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param A: array of inputs of class A
+    :param B: array of inputs of class B
+    :param n_inp: number of wires the feature map acts on
+    :return: tuple of the cost and its gradient, an array in the shape of pars
+    """
+    n_A, n_B = len(A), len(B)
+    X = np.concatenate([A, B])
+
+    closed_form = _single_wire(_single_wire_overlap_cost_and_grad, featmap, pars, X, n_A, n_B, n_inp)
+    if closed_form is not None:
+        return closed_form
+
+    states, vjp = feature_states_vjp(featmap, pars, X, n_inp)
+    A_states = states[:n_A]
+    B_states = states[n_A:]
+
+    rho_B_on_A = _projection(A_states, B_states)
+    rho_A_on_B = _projection(B_states, A_states)
+    cst = np.vdot(A_states, rho_B_on_A).real / (n_A * n_B)
+
+    adjoints = np.concatenate([rho_B_on_A, rho_A_on_B]) / (n_A * n_B)
+    return cst, vjp(adjoints)
@@ -0,0 +1,116 @@
+"""
+Datasets
+========
+
+Binary storage of features and labels.
+
+``load()`` opens features and labels as memory-mapped arrays
+``load_array()`` opens one array, converting its text file on first use
+``convert()`` converts a text file such as ./data/X_2d_sep.txt to a .npy file
+``save()`` writes features and labels as .npy files
+``create()`` creates memory-mapped .npy files to be filled chunk by chunk
+``chunks()`` iterates over fixed-size chunks of features and labels
+
+Every array is stored in a .npy file next to its text file, X_2d_sep.txt -> X_2d_sep.npy.
+Paths can be given with either extension. The .npy file is (re)written from the text
+file when it is missing or older than the text file, and afterwards opened with
+``np.load(..., mmap_mode='r')``, so that only the chunks that are used are read from disk.
+The .npy files in ./data are caches of the tracked text files and are ignored by git.
+"""
+import os
+import numpy as np
+
+
+def _paths(path):
+    """Text and binary file of an array, given the path of either one."""
+    root, ext = os.path.splitext(path)
+    if ext not in ('.txt', '.npy'):
+        root = path
+    return root + '.txt', root + '.npy'
+
+
+def convert(path, ndmin=1):
+    """
+    Converts a text file of an array to a .npy file.
+
+    :param path: path of the text file
+    :param ndmin: minimal number of dimensions of the array, 2 for features
+    :return: path of the .npy file
+    """
+    txt, npy = _paths(path)
+    array = np.loadtxt(txt, ndmin=ndmin)
+    # Write to a temporary file first, so that readers never see a partial file
+    tmp = '{}.{}.tmp'.format(npy, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, npy)
+    return npy
+
+
+def load_array(path, mmap_mode='r', ndmin=1):
+    """
+    Opens an array, converting its text file if the .npy file is missing or outdated.
+
+    :param path: path of the text or .npy file
+    :param mmap_mode: memory-map mode of ``np.load``, None to read the whole array
+    :param ndmin: minimal number of dimensions of the array, 2 for features
+    :return: array
+    """
+    txt, npy = _paths(path)
+    if os.path.exists(txt) and (not os.path.exists(npy) or
+                                os.path.getmtime(txt) > os.path.getmtime(npy)):
+        convert(txt, ndmin=ndmin)
+    array = np.load(npy, mmap_mode=mmap_mode)
+    if array.ndim < ndmin:
+        array = array.reshape(array.shape + (1,) * (ndmin - array.ndim))
+    return array
+
+
+def load(path_X, path_Y, mmap_mode='r'):
+    """
+    Opens features and labels.
+
+    :param path_X: path of the features, of shape (N, d)
+    :param path_Y: path of the labels, of shape (N,)
+    :param mmap_mode: memory-map mode of ``np.load``, None to read the whole arrays
+    :return: tuple of arrays (X, Y)
+    """
+    X = load_array(path_X, mmap_mode=mmap_mode, ndmin=2)
+    Y = load_array(path_Y, mmap_mode=mmap_mode)
+    if len(X) != len(Y):
+        raise ValueError("Got {} inputs but {} labels.".format(len(X), len(Y)))
+    return X, Y
+
+
+def save(path_X, path_Y, X, Y):
+    """Writes features and labels as .npy files."""
+    np.save(_paths(path_X)[1], np.asarray(X, dtype=float))
+    np.save(_paths(path_Y)[1], np.asarray(Y, dtype=float))
+
+
+def create(path_X, path_Y, n_samples, dim):
+    """
+    Creates memory-mapped .npy files for n_samples inputs of dimension dim.
+
+    :return: tuple of writable memory-mapped arrays (X, Y) of shapes (n_samples, dim) and (n_samples,)
+    """
+    X = np.lib.format.open_memmap(_paths(path_X)[1], mode='w+', dtype=float, shape=(n_samples, dim))
+    Y = np.lib.format.open_memmap(_paths(path_Y)[1], mode='w+', dtype=float, shape=(n_samples,))
+    return X, Y
+
+
+def chunks(X, Y=None, chunk_size=4096):
+    """
+    Iterates over consecutive chunks of at most chunk_size inputs.
+
+    :param X: array of inputs
+    :param Y: array of labels, or None
+    :param chunk_size: number of inputs per chunk
+    :return: generator of arrays X_chunk, or of tuples (X_chunk, Y_chunk) if Y is given
+    """
+    for start in range(0, len(X), chunk_size):
+        stop = min(start + chunk_size, len(X))
+        if Y is None:
+            yield np.asarray(X[start:stop])
+        else:
+            yield np.asarray(X[start:stop]), np.asarray(Y[start:stop])
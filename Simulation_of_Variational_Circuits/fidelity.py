@@ -6,21 +6,52 @@ Implements the fidelity classifier.
 
 ``predict()`` returns the predicted label or continuous output for a new input
 ``accuracy()`` returns the accuracy on a test set
+``margins()`` returns overlap_A - overlap_B for all test inputs, computed in a pool of workers
+``evaluate()`` returns the accuracy together with the margins and predictions of all test inputs
+``shot_cost()`` returns the number of shots needed to resolve the prediction of each test input
+``compile_classifier()`` returns the eigendecomposition of the measurement operator rho_A - rho_B
 
 The 'exact' implementation computes overlap of ket vectors numerically.
 The 'circuit' implementation performs a swap test on all data pairs.
-
+The 'fast' implementation applies the embedding of a sample and the inverse embedding of
+the new input on the n-qubit register, and reads off the probability of |0..0>.
+The 'compiled' implementation precomputes the Helstrom-style operator M = rho_A - rho_B
+from the mean density matrices of the classes once per set of weights, so that
+overlap_A - overlap_B = <phi(x_new)|M|phi(x_new)> costs the same for any number of
+training samples, and ``accuracy()`` scores all test inputs with one matrix product.
+
+probs_A and probs_B mean the same in every implementation: without n_samples they
+weight the overlaps with all samples, with n_samples they are the probabilities with
+which the samples are drawn. Earlier versions ignored them in 'exact', 'fast' and
+'circuit' without n_samples, and averaged uniformly there.
+
+With a number of shots, the overlaps are estimated from finite measurement statistics
+of the SWAP test ('circuit') or of the overlap circuit ('fast' and 'exact'), see ``shots``.
+
+Loaded feature maps are cached in memory, together with the embedded states of the
+training samples, so that repeated calls only simulate the new inputs. A cached entry is
+replaced as soon as the file it was loaded from changes.
+
+path_to_featmap is either a settings file of ``embedding_training.ipynb`` or a model
+directory of ``models``. A model directory is opened without unpickling, its samples
+are memory-mapped views, and embedded states stored with the model are used directly.
+
+``margins()`` splits the test set into chunks and scores them in a process or thread pool.
+For 'exact' and 'compiled', the embedded states of the training samples are computed once
+and placed in shared memory, from which every worker process reads them instead of
+embedding the samples again.
 """
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
 import pennylane as qml
 from pennylane import numpy as np
 import dill as pickle  # to load featuremap
-
-
-def negate(item):
-    if isinstance(item, list):
-        return [-i for i in item]
-    else:
-        return -item
+import instrumentation
+import models
+import shots as shot_sampling
+from kernels import fidelities
+from statevector import feature_states, pair_overlaps
 
 
 def cphase_inv(k):
@@ -31,42 +62,29 @@ def cphase_inv(k):
     return np.array(gate)
 
 
-def _fast(x_new, A_samples, B_samples, featmap, pars, n_inp):
+def _mean(overlaps, probs=None):
+    """Mean of the overlaps with the samples of a class, weighted by probs if given."""
+    if probs is None:
+        return np.mean(overlaps)
+    return np.dot(probs, overlaps)
+
+
+def _fast(x_new, A_samples, B_samples, featmap, pars, n_inp, probs_A=None, probs_B=None):
     """
-    Implements the fidelity measurement circuit using the "overlap with 0" trick.
+    Implements the fidelity measurement circuit using the "overlap with 0" trick: the
+    samples are embedded, followed by the inverse embedding of x_new, on n_inp wires,
+    and the overlap is the probability of measuring |0..0>. See ``statevector.pair_overlaps()``.
     """
-    # Allocate registers
-    dev = qml.device('default.qubit', wires=n_inp)
-    # Identify input register wires
-    wires = list(range(n_inp))
-    Proj0 = np.zeros((2**n_inp, 2**n_inp))
-    Proj0[0, 0] = 1
+    x_new = np.reshape(x_new, (1, -1))
+    overlaps = pair_overlaps(featmap, pars, np.concatenate([A_samples, B_samples]), x_new, n_inp)
 
-    @qml.qnode(dev)
-    def circuit(weights, x1=None, x2=None):
-        # Apply embedding
-        featmap(weights, x1, wires)
-        # Apply inverse embedding
-        featmap(negate(weights), negate(x2), wires)
-        # Measure overlap with |0..0>
-        return qml.expval(qml.Hermitian(Proj0, wires=wires))
-
-    # Compute mean overlap with A
-    overlap_A = 0
-    for a in A_samples:
-        overlap_A += circuit(pars, x1=a, x2=x_new)
-    overlap_A = overlap_A/len(A_samples)
-
-    # Compute mean overlap with B
-    overlap_B = 0
-    for b in B_samples:
-        overlap_B += circuit(pars, x1=b, x2=x_new)
-    overlap_B = overlap_B/len(B_samples)
+    overlap_A = _mean(overlaps[:len(A_samples)], probs_A)
+    overlap_B = _mean(overlaps[len(A_samples):], probs_B)
 
     return overlap_A, overlap_B
 
 
-def _circuit(x_new, A_samples, B_samples, featmap, pars, n_inp):
+def _circuit(x_new, A_samples, B_samples, featmap, pars, n_inp, probs_A=None, probs_B=None):
     """
     Implements the fidelity measurement circuit using samples of class A and B.
     """
@@ -92,74 +110,175 @@ def _circuit(x_new, A_samples, B_samples, featmap, pars, n_inp):
         # Measure overlap by checking ancilla
         return qml.expval(qml.PauliZ(0))
 
-    # Compute mean overlap with A
-    overlap_A = 0
-    for a in A_samples:
-        overlap_A += circuit(pars, x1=a, x2=x_new)
-    overlap_A = overlap_A/len(A_samples)
+    instrumentation.count('circuits', len(A_samples) + len(B_samples))
+    with instrumentation.phase('swap_test'):
+        # Compute mean overlap with A
+        overlap_A = _mean([circuit(pars, x1=a, x2=x_new) for a in A_samples], probs_A)
 
-    # Compute mean overlap with B
-    overlap_B = 0
-    for b in B_samples:
-        overlap_B += circuit(pars, x1=b, x2=x_new)
-    overlap_B = overlap_B/len(B_samples)
+        # Compute mean overlap with B
+        overlap_B = _mean([circuit(pars, x1=b, x2=x_new) for b in B_samples], probs_B)
 
     return overlap_A, overlap_B
 
 
-def _exact(x_new, A_samples, B_samples, featmap, n_inp, pars):
+def _exact(x_new, A_states, B_states, featmap, n_inp, pars, probs_A=None, probs_B=None):
     """Calculates the analytical result of the fidelity measurement,
 
         overlap_A = \sum_i p_A |<\phi(x_new)|\phi(a_i)>|^2,
         overlap_B = \sum_i p_B |<\phi(x_new)|\phi(b_i)>|^2,
 
-        using numpy as well as pennylane to simulate the feature map.
+        using numpy to simulate the feature map, with uniform p_A and p_B if no probabilities
+        are given. The states of the samples in A and B are passed in precomputed, see
+        ``_support_states()``.
      """
 
-    dev = qml.device('default.qubit', wires=n_inp)
+    # Get feature state for new input
+    phi_x = feature_states(featmap, pars, [x_new], n_inp)[0]
 
-    @qml.qnode(dev)
-    def fm(weights, x=None):
-        """Circuit to get the state after feature map"""
-        featmap(weights, x, range(n_inp))
-        return qml.expval(qml.PauliZ(0))
+    # Put together
+    overlap_A = _mean(np.abs(A_states @ phi_x.conj()) ** 2, probs_A)
+    overlap_B = _mean(np.abs(B_states @ phi_x.conj()) ** 2, probs_B)
 
-    # Compute feature states for A
-    A_states = []
-    for a in A_samples:
-        fm(pars, x=a)
-        phi_a = dev._state
-        A_states.append(phi_a)
+    return overlap_A, overlap_B
 
-    # Compute feature states for B
-    B_states = []
-    for b in B_samples:
-        fm(pars, x=b)
-        phi_b = dev._state
-        B_states.append(phi_b)
 
-    # Get feature state for new input
-    fm(pars, x=x_new)
-    phi_x = dev._state
+# Loaded feature maps, keyed by the absolute path of their settings file or model directory
+_cache = {}
+
+
+def _load(path_to_featmap):
+    """
+    Loads the settings of a trained feature map, unpickling the feature map only once.
+
+    The entry is kept in memory and reused until the modification time of the file
+    changes, in which case it is replaced by a fresh load.
+
+    :param path_to_featmap: Where to load featmap from.
+    :return: dict with the settings and a slot 'states' for the embedded training samples
+    """
+    path = os.path.abspath(path_to_featmap)
+    is_model = models.is_model(path)
+    mtime = os.path.getmtime(os.path.join(path, models.SPEC) if is_model else path)
+
+    entry = _cache.get(path)
+    if entry is not None and entry['mtime'] == mtime:
+        return entry
+
+    if is_model:
+        model = models.load(path)
+        entry = {'mtime': mtime,
+                 'featmap': model.featmap,
+                 'pars': model.pars,
+                 'n_inp': model.n_wires,
+                 'A': model.samples(1),
+                 'B': model.samples(-1),
+                 'states': {},
+                 'compiled': {}}
+        if model.states is not None:
+            entry['states'][np.asarray(model.pars).tobytes()] = (model.class_states(1),
+                                                                 model.class_states(-1))
+    else:
+        settings = np.load(path, allow_pickle=True).item()
+        X = settings['X']
+        Y = settings['Y']
+        entry = {'mtime': mtime,
+                 'featmap': pickle.loads(settings['featmap']),
+                 'pars': settings['pars'],
+                 'n_inp': settings['n_wires'],
+                 'A': X[Y == 1],
+                 'B': X[Y == -1],
+                 'states': {},
+                 'compiled': {}}
+    _cache[path] = entry
+
+    return entry
+
+
+def _support_states(entry, pars):
+    """
+    Returns the embedded states of all samples in A and B, computing them only on the
+    first call for a given set of parameters.
+
+    :param entry: loaded feature map, see ``_load()``
+    :param pars: weights of the feature map
+    :return: tuple of state arrays of shape (len(A), 2**n_inp) and (len(B), 2**n_inp)
+    """
+    key = np.asarray(pars).tobytes()
+    if key not in entry['states']:
+        A, B = entry['A'], entry['B']
+        states = feature_states(entry['featmap'], pars, np.concatenate([A, B]), entry['n_inp'])
+        entry['states'][key] = (states[:len(A)], states[len(A):])
+    return entry['states'][key]
+
+
+def _helstrom(A_states, B_states, probs_A=None, probs_B=None):
+    """
+    Computes the eigendecomposition of M = rho_A - rho_B, with the mean density matrices
+    rho_A and rho_B of the samples, weighted by probs_A and probs_B if given. Only the
+    eigenvectors with non-zero eigenvalue are kept, at most len(A) + len(B) of them.
+
+    :return: tuple of the eigenvalues of shape (r,) and the eigenvectors of shape (2**n_inp, r)
+    """
+    weights_A = np.full(len(A_states), 1 / len(A_states)) if probs_A is None else np.asarray(probs_A)
+    weights_B = np.full(len(B_states), 1 / len(B_states)) if probs_B is None else np.asarray(probs_B)
+    M = (A_states.T * weights_A) @ A_states.conj() - (B_states.T * weights_B) @ B_states.conj()
+    eigenvalues, eigenvectors = np.linalg.eigh(M)
+    keep = np.abs(eigenvalues) > 1e-12 * max(np.max(np.abs(eigenvalues)), 1e-300)
+    return eigenvalues[keep], eigenvectors[:, keep]
+
+
+def _score(states, compiled):
+    """Computes <phi|M|phi> for all states from the eigendecomposition of M."""
+    eigenvalues, eigenvectors = compiled
+    return np.real(np.abs(states.conj() @ eigenvectors) ** 2 @ eigenvalues)
 
-    # Put together
-    overlap_A = sum([np.abs(np.vdot(phi_x, phi_a)) ** 2 for phi_a in A_states])
-    overlap_A = overlap_A/len(A_states)
 
-    overlap_B = sum([np.abs(np.vdot(phi_x, phi_b)) ** 2 for phi_b in B_states])
-    overlap_B = overlap_B/len(B_states)
+def compile_classifier(path_to_featmap, probs_A=None, probs_B=None):
+    """
+    Precomputes the measurement operator M = rho_A - rho_B of the classifier, once per
+    set of weights and sample probabilities.
 
+    :param path_to_featmap: Where to load featmap from.
+    :param probs_A: Probabilities with which to draw each samples from A. If None, use uniform.
+    :param probs_B: Probabilities with which to draw each samples from B. If None, use uniform.
+    :return: tuple of the non-zero eigenvalues of M and the corresponding eigenvectors,
+        of shapes (r,) and (2**n_inp, r)
+    """
+    entry = _load(path_to_featmap)
+    pars = entry['pars']
+    key = tuple(None if p is None else np.asarray(p, dtype=float).tobytes()
+                for p in (pars, probs_A, probs_B))
+    if key not in entry['compiled']:
+        A_states, B_states = _support_states(entry, pars)
+        entry['compiled'][key] = _helstrom(A_states, B_states, probs_A, probs_B)
+    return entry['compiled'][key]
+
+
+def _shot_overlaps(x_new, A_states, B_states, featmap, n_inp, pars, probs_A, probs_B,
+                   shots, circuit, rng):
+    """Estimates the mean overlaps with A and B from shots shots per class."""
+    phi_x = feature_states(featmap, pars, [x_new], n_inp)
+    overlap_A, _ = shot_sampling.estimate_mean_overlap(fidelities(phi_x, A_states)[0], shots,
+                                                       probs=probs_A, circuit=circuit, rng=rng)
+    overlap_B, _ = shot_sampling.estimate_mean_overlap(fidelities(phi_x, B_states)[0], shots,
+                                                       probs=probs_B, circuit=circuit, rng=rng)
     return overlap_A, overlap_B
 
 
+@instrumentation.timed('predict')
 def predict(x_new, path_to_featmap, n_samples=None,
-            probs_A=None, probs_B=None, binary=True, implementation=None, seed=None):
+            probs_A=None, probs_B=None, binary=True, implementation=None, seed=None, shots=None):
     """
     Predicts which class the new input is from, using either exact numerical simulation
     or a simulated quantum circuit.
 
     As a convention, the class labeled by +1 is 'A', the class labeled by -1 is 'B'.
 
+    probs_A and probs_B are used the same way by all implementations. With n_samples, the
+    samples are drawn with these probabilities and their overlaps are averaged uniformly.
+    Without n_samples, the overlaps with all samples are averaged with these probabilities
+    as weights, so that both give the same overlaps in expectation.
+
     :param x_new: new input to predict label for
     :param path_to_featmap: Where to load featmap from.
     :param n_samples: How many samples to use, if None, use full class (simulating perfect measurement)
@@ -167,7 +286,9 @@ def predict(x_new, path_to_featmap, n_samples=None,
     :param probs_B: Probabilities with which to draw each samples from B. If None, use uniform.
     :param binary: If True, return probability, else return value {-1, 1}
     :param implementation: String that chooses the background implementation. Can be 'exact',
-        'fast' or 'circuit'
+        'fast', 'circuit' or 'compiled'
+    :param shots: If not None, estimate each mean overlap from this many shots of the SWAP test
+        ('circuit') or the overlap circuit ('exact', 'fast'), each on a randomly drawn sample
     :return: probability or prediction of class for x_new
     """
 
@@ -175,14 +296,12 @@ def predict(x_new, path_to_featmap, n_samples=None,
         np.random.seed(seed)
 
     # Load settings from result of featmap learning function
-    settings = np.load(path_to_featmap, allow_pickle=True).item()
-    featmap = pickle.loads(settings['featmap'])
-    pars = settings['pars']
-    n_inp = settings['n_wires']
-    X = settings['X']
-    Y = settings['Y']
-    A = X[Y == 1]
-    B = X[Y == -1]
+    entry = _load(path_to_featmap)
+    featmap = entry['featmap']
+    pars = entry['pars']
+    n_inp = entry['n_inp']
+    A = entry['A']
+    B = entry['B']
 
     if probs_A is not None and len(probs_A) != len(A):
         raise ValueError("Length of probs_A and A have to be the same, got {} and {}."
@@ -193,24 +312,47 @@ def predict(x_new, path_to_featmap, n_samples=None,
 
     # Sample subsets from A and B
     if n_samples is None:
-        # Consider all samples from A, B
-        A_samples = A
-        B_samples = B
+        # Consider all samples from A, B, weighted by their probabilities
+        selectA = slice(None)
+        selectB = slice(None)
+        weights_A, weights_B = probs_A, probs_B
     else:
+        # Drawn samples are weighted uniformly
+        weights_A = weights_B = None
         selectA = np.random.choice(range(len(A)), size=(n_samples,), replace=True, p=probs_A)
-        A_samples = A[selectA]
         selectB = np.random.choice(range(len(B)), size=(n_samples,), replace=True, p=probs_B)
-        B_samples = B[selectB]
-
-    if implementation == "exact":
-        overlap_A, overlap_B = _exact(x_new=x_new, A_samples=A_samples, B_samples=B_samples,
-                                      featmap=featmap, n_inp=n_inp, pars=pars)
+    A_samples = A[selectA]
+    B_samples = B[selectB]
+
+    if shots is not None:
+        if implementation not in ("exact", "circuit", "fast"):
+            raise ValueError("Implementation not recognized.")
+        A_states, B_states = _support_states(entry, pars)
+        circuit = "swap" if implementation == "circuit" else "overlap"
+        rng = np.random.default_rng(seed)
+        overlap_A, overlap_B = _shot_overlaps(x_new, A_states[selectA], B_states[selectB], featmap,
+                                              n_inp, pars, weights_A, weights_B, shots, circuit, rng)
+    elif implementation == "compiled":
+        if n_samples is None:
+            compiled = compile_classifier(path_to_featmap, probs_A, probs_B)
+        else:
+            A_states, B_states = _support_states(entry, pars)
+            compiled = _helstrom(A_states[selectA], B_states[selectB])
+        difference = _score(feature_states(featmap, pars, [x_new], n_inp), compiled)[0]
+        overlap_A, overlap_B = difference, 0
+    elif implementation == "exact":
+        A_states, B_states = _support_states(entry, pars)
+        overlap_A, overlap_B = _exact(x_new=x_new, A_states=A_states[selectA], B_states=B_states[selectB],
+                                      featmap=featmap, n_inp=n_inp, pars=pars,
+                                      probs_A=weights_A, probs_B=weights_B)
     elif implementation == "circuit":
         overlap_A, overlap_B = _circuit(x_new=x_new, A_samples=A_samples, B_samples=B_samples,
-                                        featmap=featmap, pars=pars, n_inp=n_inp)
+                                        featmap=featmap, pars=pars, n_inp=n_inp,
+                                        probs_A=weights_A, probs_B=weights_B)
     elif implementation == "fast":
         overlap_A, overlap_B = _fast(x_new=x_new, A_samples=A_samples, B_samples=B_samples,
-                                     featmap=featmap, pars=pars, n_inp=n_inp)
+                                     featmap=featmap, pars=pars, n_inp=n_inp,
+                                     probs_A=weights_A, probs_B=weights_B)
     else:
         raise ValueError("Implementation not recognized.")
 
@@ -225,8 +367,9 @@ def predict(x_new, path_to_featmap, n_samples=None,
         return overlap_A - overlap_B
 
 
+@instrumentation.timed('accuracy')
 def accuracy(X, Y, path_to_featmap, n_samples=None, probs_A=None, probs_B=None,
-             implementation=None, seed=None):
+             implementation=None, seed=None, n_workers=None):
     """
     Computes the ratio of correctly classified samples to all samples.
 
@@ -237,9 +380,25 @@ def accuracy(X, Y, path_to_featmap, n_samples=None, probs_A=None, probs_B=None,
     :param probs_A: Probabilities with which to draw each samples from A. If None, use uniform.
     :param probs_B: Probabilities with which to draw each samples from B. If None, use uniform.
     :param implementation: String that chooses the background implementation.
+    :param n_workers: If not None, score the test set in this many worker processes, see ``margins()``.
+        Only supported without n_samples.
     :return: accuracy of predictions on test set
     """
 
+    if n_workers is not None:
+        if n_samples is not None:
+            raise ValueError("n_workers is only supported with n_samples=None, the drawn samples "
+                             "of every test input are not reproducible across workers.")
+        return evaluate(X, Y, path_to_featmap, probs_A=probs_A, probs_B=probs_B,
+                        implementation=implementation, n_workers=n_workers)['accuracy']
+
+    if implementation == "compiled" and n_samples is None:
+        # Score all test inputs at once
+        entry = _load(path_to_featmap)
+        states = feature_states(entry['featmap'], entry['pars'], X, entry['n_inp'])
+        y_pred = np.sign(_score(states, compile_classifier(path_to_featmap, probs_A, probs_B)))
+        return np.mean(np.asarray(Y) == y_pred)
+
     acc = []
     for x_test, y_test in zip(X, Y):
         y_pred = predict(x_new=x_test,
@@ -258,3 +417,161 @@ def accuracy(X, Y, path_to_featmap, n_samples=None, probs_A=None, probs_B=None,
 
     return sum(acc)/len(acc)
 
+
+def shot_cost(X, path_to_featmap, implementation="circuit", probs_A=None, probs_B=None,
+              shots_per_round=64, max_shots=100000, z=3.0, seed=None):
+    """
+    Estimates how many shots the classification of each test input needs, by adding
+    shots to the estimates of overlap_A and overlap_B until the sign of their difference
+    is resolved, see ``shots.resolve_sign()``.
+
+    :param X: Array of test inputs
+    :param path_to_featmap: Where to load featmap from.
+    :param implementation: 'circuit' for the SWAP test, 'fast' or 'exact' for the overlap circuit
+    :param probs_A: Probabilities with which to draw each samples from A. If None, use uniform.
+    :param probs_B: Probabilities with which to draw each samples from B. If None, use uniform.
+    :param shots_per_round: number of shots added per round and test input
+    :param max_shots: maximal number of shots per test input
+    :param z: number of standard errors that separate the difference from zero
+    :return: dict of arrays, see ``shots.resolve_sign()``
+    """
+    entry = _load(path_to_featmap)
+    featmap, pars, n_inp = entry['featmap'], entry['pars'], entry['n_inp']
+    A_states, B_states = _support_states(entry, pars)
+    states = feature_states(featmap, pars, X, n_inp)
+    circuit = "swap" if implementation == "circuit" else "overlap"
+    return shot_sampling.resolve_sign(fidelities(states, A_states), fidelities(states, B_states),
+                                      probs_A=probs_A, probs_B=probs_B, circuit=circuit,
+                                      shots_per_round=shots_per_round, max_shots=max_shots, z=z,
+                                      rng=seed)
+
+
+def _chunk_margins(path_to_featmap, X, implementation, probs_A, probs_B):
+    """Computes overlap_A - overlap_B for a chunk of test inputs, as ``predict()`` does for one."""
+    entry = _load(path_to_featmap)
+    featmap, pars, n_inp = entry['featmap'], entry['pars'], entry['n_inp']
+    if implementation == "compiled":
+        states = feature_states(featmap, pars, X, n_inp)
+        return _score(states, compile_classifier(path_to_featmap, probs_A, probs_B))
+    if implementation == "exact":
+        A_states, B_states = _support_states(entry, pars)
+        states = feature_states(featmap, pars, X, n_inp)
+        overlaps_A, overlaps_B = fidelities(states, A_states), fidelities(states, B_states)
+        return (np.mean(overlaps_A, axis=1) if probs_A is None else overlaps_A @ probs_A) - \
+               (np.mean(overlaps_B, axis=1) if probs_B is None else overlaps_B @ probs_B)
+    if implementation in ("fast", "circuit"):
+        score = _fast if implementation == "fast" else _circuit
+        margins = []
+        for x in X:
+            overlap_A, overlap_B = score(x_new=x, A_samples=entry['A'], B_samples=entry['B'],
+                                         featmap=featmap, pars=pars, n_inp=n_inp,
+                                         probs_A=probs_A, probs_B=probs_B)
+            margins.append(overlap_A - overlap_B)
+        return np.array(margins, dtype=float)
+    raise ValueError("Implementation not recognized.")
+
+
+# Shared memory block of the support states, held open by every worker process
+_shared = None
+
+
+def _init_worker(path_to_featmap, name, n_A, n_B, dim):
+    """Attaches a worker process to the support states in shared memory."""
+    global _shared
+    _shared = shared_memory.SharedMemory(name=name)
+    states = np.ndarray((n_A + n_B, dim), dtype=complex, buffer=_shared.buf)
+    entry = _load(path_to_featmap)
+    entry['states'][np.asarray(entry['pars']).tobytes()] = (states[:n_A], states[n_A:])
+
+
+def margins(X, path_to_featmap, probs_A=None, probs_B=None, implementation="exact",
+            n_workers=None, chunk_size=256, backend="process"):
+    """
+    Computes overlap_A - overlap_B for all test inputs, splitting the test set into chunks
+    that are scored in a pool of workers. The sign of a margin is the prediction of
+    ``predict()``.
+
+    With the 'process' backend, each worker process loads the feature map once. For the
+    'exact' and 'compiled' implementations, the embedded states of the training samples
+    are computed once and placed in shared memory; 'fast' and 'circuit' simulate circuits
+    of the samples themselves and do not use them. The 'thread' backend shares the loaded
+    feature map of this process, and pays off where the work is dominated by numpy, which
+    releases the GIL.
+
+    All samples of both classes are used, as in ``predict()`` with n_samples=None; shots
+    are not supported.
+
+    :param X: Array of test inputs
+    :param path_to_featmap: Where to load featmap from.
+    :param probs_A: Weights of the overlaps with the samples of A. If None, use uniform.
+    :param probs_B: Weights of the overlaps with the samples of B. If None, use uniform.
+    :param implementation: String that chooses the background implementation. Can be 'exact',
+        'fast', 'circuit' or 'compiled'
+    :param n_workers: Number of workers, defaults to the number of CPUs; with 1 the test set
+        is scored in this process
+    :param chunk_size: Number of test inputs per task
+    :param backend: 'process' or 'thread'
+    :return: array of shape (len(X),)
+    """
+    if implementation not in ("exact", "fast", "circuit", "compiled"):
+        raise ValueError("Implementation not recognized.")
+    if backend not in ("process", "thread"):
+        raise ValueError("Backend {} not recognized, use 'process' or 'thread'.".format(backend))
+    X = np.asarray(X)
+    chunks = [X[i:i + chunk_size] for i in range(0, len(X), chunk_size)]
+    args = (implementation, probs_A, probs_B)
+
+    entry = _load(path_to_featmap)
+    if n_workers == 1 or len(chunks) <= 1:
+        results = [_chunk_margins(path_to_featmap, chunk, *args) for chunk in chunks]
+    elif backend == "thread":
+        # Prepare the shared data once, instead of in every thread
+        if implementation == "compiled":
+            compile_classifier(path_to_featmap, probs_A, probs_B)
+        elif implementation == "exact":
+            _support_states(entry, entry['pars'])
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(lambda chunk: _chunk_margins(path_to_featmap, chunk, *args),
+                                        chunks))
+    elif implementation in ("fast", "circuit"):
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_chunk_margins, path_to_featmap, chunk, *args) for chunk in chunks]
+            results = [future.result() for future in futures]
+    else:
+        A_states, B_states = _support_states(entry, entry['pars'])
+        n_A, dim = A_states.shape
+        n_B = len(B_states)
+        block = shared_memory.SharedMemory(create=True, size=max((n_A + n_B) * dim * 16, 1))
+        try:
+            shared = np.ndarray((n_A + n_B, dim), dtype=complex, buffer=block.buf)
+            shared[:n_A] = A_states
+            shared[n_A:] = B_states
+            del shared
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                     initargs=(path_to_featmap, block.name, n_A, n_B, dim)) as executor:
+                futures = [executor.submit(_chunk_margins, path_to_featmap, chunk, *args)
+                           for chunk in chunks]
+                results = [future.result() for future in futures]
+        finally:
+            block.close()
+            block.unlink()
+
+    return np.concatenate(results) if results else np.zeros(0)
+
+
+def evaluate(X, Y, path_to_featmap, probs_A=None, probs_B=None, implementation="exact",
+             n_workers=None, chunk_size=256, backend="process"):
+    """
+    Scores a test set with ``margins()``.
+
+    :param X: Array of test inputs
+    :param Y: 1-d array of test labels
+    :return: dict with the 'accuracy', and the 'margins' overlap_A - overlap_B and the
+        'predictions' in {-1, 0, 1} of all test inputs
+    """
+    m = margins(X, path_to_featmap, probs_A=probs_A, probs_B=probs_B, implementation=implementation,
+                n_workers=n_workers, chunk_size=chunk_size, backend=backend)
+    predictions = np.sign(m).astype(int)
+    return {'accuracy': float(np.mean(predictions == np.asarray(Y))) if len(m) else float('nan'),
+            'margins': m,
+            'predictions': predictions}
@@ -0,0 +1,107 @@
+"""
+Data generators
+===============
+
+Synthetic two-class datasets of any size and dimension, drawn as whole arrays.
+
+``separable()`` returns inputs in [-1, 1]^d (label -1) and in the corner cubes [1, 2]^d and [-2, -1]^d (label 1)
+``xor()`` returns inputs in [-1, 1]^d labelled by the sign of the product of their features
+``add_margin()`` shifts every feature away from zero by a margin
+``chunks()`` draws a large dataset chunk by chunk
+``write()`` draws a large dataset into memory-mapped .npy files
+
+All generators take a seed or a ``np.random.Generator`` as rng. Labels are floats -1.0
+and 1.0, like the files in ./data.
+"""
+import numpy as np
+import datasets
+
+
+def separable(n_samples, dim=2, rng=None):
+    """
+    Draws the separable dataset of ``generate_data()``. Each input belongs to either class
+    with probability 1/2. Inputs with label -1 are uniform in [-1, 1]^d, inputs with
+    label 1 are uniform in [1, 2]^d or [-2, -1]^d with probability 1/2 each.
+
+    :param n_samples: number of inputs
+    :param dim: dimension of the inputs
+    :param rng: seed or ``np.random.Generator``
+    :return: tuple of arrays X of shape (n_samples, dim) and Y of shape (n_samples,)
+    """
+    rng = np.random.default_rng(rng)
+    Y = np.where(rng.random(n_samples) < 0.5, -1.0, 1.0)
+    X = rng.uniform(-1.0, 1.0, size=(n_samples, dim))
+    # Class 1: |x_i| in [1, 2], with one sign for all features of an input
+    outer = Y == 1
+    sign = np.where(rng.random(np.count_nonzero(outer)) < 0.5, -1.0, 1.0)
+    X[outer] = sign[:, None] * (1.5 + 0.5 * X[outer])
+    return X, Y
+
+
+def add_margin(X, margin):
+    """Shifts every feature by margin * sign(x), with sign(0) = 1, in place."""
+    X += np.where(X < 0, -margin, margin)
+    return X
+
+
+def xor(n_samples, dim=2, margin=0.0, rng=None):
+    """
+    Draws inputs uniform in [-1, 1]^d with label 1 if the product of their features is
+    positive and -1 otherwise. For d = 2 and a margin this is the dataset of
+    risk_function/2d_data.
+
+    :param n_samples: number of inputs
+    :param dim: dimension of the inputs
+    :param margin: gap between the classes, every feature is shifted away from zero by margin
+    :param rng: seed, ``np.random.Generator``, or ``np.random.RandomState`` such as the
+        global state of np.random, to draw the stream of np.random.seed
+    :return: tuple of arrays X of shape (n_samples, dim) and Y of shape (n_samples,)
+    """
+    if not isinstance(rng, np.random.RandomState):
+        rng = np.random.default_rng(rng)
+    X = rng.uniform(-1.0, 1.0, size=(n_samples, dim))
+    Y = np.where(np.prod(X, axis=1) > 0, 1.0, -1.0)
+    if margin:
+        add_margin(X, margin)
+    return X, Y
+
+
+def chunks(generator, n_samples, dim=2, chunk_size=1000000, rng=None, **kwargs):
+    """
+    Draws a dataset of n_samples inputs in chunks of at most chunk_size inputs.
+
+    :param generator: one of the generators of this module, such as ``separable``
+    :param n_samples: total number of inputs
+    :param dim: dimension of the inputs
+    :param chunk_size: number of inputs per chunk
+    :param rng: seed or ``np.random.Generator``, shared by all chunks
+    :param kwargs: keyword arguments of the generator, such as margin
+    :return: generator of tuples (X_chunk, Y_chunk)
+    """
+    rng = np.random.default_rng(rng)
+    for start in range(0, n_samples, chunk_size):
+        yield generator(min(chunk_size, n_samples - start), dim, rng=rng, **kwargs)
+
+
+def write(generator, path_X, path_Y, n_samples, dim=2, chunk_size=1000000, rng=None, **kwargs):
+    """
+    Draws a dataset chunk by chunk into memory-mapped .npy files, which ``datasets.load()``
+    opens without reading them into memory.
+
+    :param generator: one of the generators of this module, such as ``separable``
+    :param path_X: path of the features
+    :param path_Y: path of the labels
+    :param n_samples: total number of inputs
+    :param dim: dimension of the inputs
+    :param chunk_size: number of inputs per chunk
+    :param rng: seed or ``np.random.Generator``
+    :param kwargs: keyword arguments of the generator, such as margin
+    """
+    X, Y = datasets.create(path_X, path_Y, n_samples, dim)
+    start = 0
+    for X_chunk, Y_chunk in chunks(generator, n_samples, dim, chunk_size, rng=rng, **kwargs):
+        X[start:start + len(X_chunk)] = X_chunk
+        Y[start:start + len(Y_chunk)] = Y_chunk
+        start += len(X_chunk)
+    X.flush()
+    Y.flush()
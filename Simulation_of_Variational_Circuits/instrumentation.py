@@ -0,0 +1,183 @@
+"""
+Instrumentation
+===============
+
+Opt-in counters and timers for circuit evaluations and cost phases.
+
+``enable()`` and ``disable()`` switch the instrumentation on and off
+``reset()`` clears all counters and timers
+``count()`` adds to a named counter
+``phase()`` returns a context manager that times a named phase
+``timed()`` decorates a function so that each call is timed as a phase
+``summary()`` returns the counters and timers as a dict
+``export()`` writes the summary of a run to a JSON file
+``recording()`` enables and resets the instrumentation for a block and collects its summary
+
+The simulator, ``fidelity.predict()`` and ``accuracy()``, the costs and the training
+loop report to this module. Counters include
+
+    circuits       circuits simulated, one per input of a batch or per QNode execution
+    gates          gates applied, summed over the circuits
+    recordings     recordings of a feature map into a tape
+    compilations   compilations of a feature map, see ``statevector``
+
+and phases include 'record', 'simulate', 'gradient', 'swap_test', 'predict', 'accuracy',
+'cost', 'log' and 'optimizer_step'. Phases may be nested, the time of a phase includes
+the time of the phases inside it.
+
+The instrumentation is disabled by default. Then ``count()`` returns after checking one
+flag, and ``phase()`` returns a shared context manager that does nothing.
+
+Usage::
+
+    with instrumentation.recording() as run:
+        fidelity.accuracy(X, Y, path)
+    instrumentation.export('accuracy.json', implementation='exact')
+"""
+import json
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+_enabled = False
+_counters = {}
+_timers = {}
+
+
+def enable():
+    """Switches the instrumentation on."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Switches the instrumentation off, keeping the collected values."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    """Checks whether the instrumentation is on."""
+    return _enabled
+
+
+def reset():
+    """Clears all counters and timers."""
+    _counters.clear()
+    _timers.clear()
+
+
+def count(name, n=1):
+    """Adds n to the counter name, if the instrumentation is on."""
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+class _Phase:
+    """Context manager that adds its duration to the timer of a phase."""
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        timer = _timers.get(self.name)
+        if timer is None:
+            _timers[self.name] = {'calls': 1, 'total': elapsed, 'min': elapsed, 'max': elapsed}
+        else:
+            timer['calls'] += 1
+            timer['total'] += elapsed
+            timer['min'] = min(timer['min'], elapsed)
+            timer['max'] = max(timer['max'], elapsed)
+        return False
+
+
+class _NoPhase:
+    """Context manager that does nothing, used while the instrumentation is off."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(name):
+    """
+    Returns a context manager that times the enclosed block as the phase name.
+
+    :param name: name of the phase
+    """
+    return _Phase(name) if _enabled else _NO_PHASE
+
+
+def timed(name):
+    """
+    Decorator that times every call of a function as the phase name.
+
+    :param name: name of the phase
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summary():
+    """
+    Returns the collected values.
+
+    :return: dict with 'counters', name -> count, and 'timers', name -> dict with the
+        number of 'calls' and the 'total', 'mean', 'min' and 'max' duration in seconds
+    """
+    timers = {}
+    for name, timer in _timers.items():
+        timers[name] = dict(timer, mean=timer['total'] / timer['calls'])
+    return {'counters': dict(_counters), 'timers': timers}
+
+
+def export(path, **metadata):
+    """
+    Writes the summary to a JSON file.
+
+    :param path: file to write
+    :param metadata: additional JSON-serializable values describing the run
+    :return: the written dict
+    """
+    run = dict(summary(), metadata=metadata, time=time.time())
+    with open(path, 'w') as f:
+        json.dump(run, f, indent=2)
+    return run
+
+
+@contextmanager
+def recording():
+    """
+    Enables and resets the instrumentation for a block. The yielded dict is filled with
+    the ``summary()`` of the block when it exits. The previous on/off state is restored.
+    """
+    was_enabled = _enabled
+    reset()
+    enable()
+    run = {}
+    try:
+        yield run
+    finally:
+        if not was_enabled:
+            disable()
+        run.update(summary())
@@ -0,0 +1,133 @@
+"""
+Kernels
+=======
+
+Computes the fidelity kernel k(x1, x2) = |<phi(x1)|phi(x2)>|^2 of a feature map.
+
+``gram()`` returns the matrix of fidelities between two sets of inputs
+``class_overlaps()`` returns the mean overlaps tr_rr, tr_ss and tr_rs of two classes
+``class_overlaps_chunked()`` returns the same overlaps for a dataset streamed in chunks
+
+Each input is embedded only once into an n-qubit state, and the fidelities of all
+pairs follow from matrix products of the state arrays. This replaces the double loop
+over a SWAP test on 2n+1 wires.
+"""
+import numpy as np
+from statevector import feature_states
+
+
+def fidelities(states1, states2=None, block_size=256):
+    """
+    Computes the fidelities |<s1|s2>|^2 between all pairs of statevectors.
+
+    If states2 is None, the symmetric matrix of states1 with itself is computed. In
+    this case only the blocks on and above the diagonal are multiplied, and the lower
+    triangle is filled in by symmetry.
+
+    :param states1: array of statevectors of shape (N1, 2**n)
+    :param states2: array of statevectors of shape (N2, 2**n), or None
+    :param block_size: number of rows per block in the symmetric case
+    :return: array of shape (N1, N2)
+    """
+    if states2 is not None:
+        return np.abs(states1.conj() @ states2.T) ** 2
+
+    n = len(states1)
+    gram = np.empty((n, n))
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = np.abs(states1[start:stop].conj() @ states1[start:].T) ** 2
+        gram[start:stop, start:] = block
+        gram[start:, start:stop] = block.T
+    return gram
+
+
+def gram(featmap, pars, X1, X2, n_inp):
+    """
+    Computes the Gram matrix of the fidelity kernel of a feature map.
+
+    If X2 is None or the same inputs as X1, the symmetric fast path is used, which
+    embeds the inputs once and only computes the upper triangle.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param X1: array of inputs of shape (N1, d)
+    :param X2: array of inputs of shape (N2, d), or None
+    :param n_inp: number of wires the feature map acts on
+    :return: array of shape (N1, N2) with entries |<phi(x1_i)|phi(x2_j)>|^2
+    """
+    states1 = feature_states(featmap, pars, X1, n_inp)
+    if X2 is None or X2 is X1 or (np.shape(X1) == np.shape(X2) and np.array_equal(X1, X2)):
+        return fidelities(states1)
+    states2 = feature_states(featmap, pars, X2, n_inp)
+    return fidelities(states1, states2)
+
+
+def _mean_overlap(states1, states2):
+    """Mean of |<s1|s2>|^2 over all pairs, from the cheaper of the two equivalent forms."""
+    n1, n2 = len(states1), len(states2)
+    dim = states1.shape[1]
+    if dim * dim < n1 * n2:
+        # tr(rho_1 rho_2) with the (unnormalised) density matrices of both sets
+        rho1 = states1.T @ states1.conj()
+        rho2 = states2.T @ states2.conj()
+        return np.real(np.sum(rho1 * rho2.T)) / (n1 * n2)
+    return np.mean(fidelities(states1, states2))
+
+
+def class_overlaps(featmap, pars, A, B, n_inp):
+    """
+    Computes the mean intra- and inter-class overlaps,
+
+        tr_rr = 1/|A|^2 \\sum_{a, a'} |<\\phi(a)|\\phi(a')>|^2,
+        tr_ss = 1/|B|^2 \\sum_{b, b'} |<\\phi(b)|\\phi(b')>|^2,
+        tr_rs = 1/(|A||B|) \\sum_{a, b} |<\\phi(a)|\\phi(b)>|^2,
+
+    which enter the Hilbert-Schmidt cost 1 - (-tr_rs + 0.5 * (tr_rr + tr_ss)).
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param A: array of inputs of class A
+    :param B: array of inputs of class B
+    :param n_inp: number of wires the feature map acts on
+    :return: tuple (tr_rr, tr_ss, tr_rs)
+    """
+    states = feature_states(featmap, pars, np.concatenate([A, B]), n_inp)
+    A_states = states[:len(A)]
+    B_states = states[len(A):]
+
+    tr_rr = _mean_overlap(A_states, A_states)
+    tr_ss = _mean_overlap(B_states, B_states)
+    tr_rs = _mean_overlap(A_states, B_states)
+    return tr_rr, tr_ss, tr_rs
+
+
+def class_overlaps_chunked(featmap, pars, chunks, n_inp, label_A=-1):
+    """
+    Computes the mean overlaps tr_rr, tr_ss and tr_rs of ``class_overlaps()`` for a
+    dataset that is streamed in chunks, for example from ``datasets.chunks()``.
+
+    Only the unnormalised density matrices of both classes are kept in memory, so the
+    memory does not grow with the size of the dataset.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param chunks: iterable of tuples (X_chunk, Y_chunk)
+    :param n_inp: number of wires the feature map acts on
+    :param label_A: label of class A, all other labels belong to class B
+    :return: tuple (tr_rr, tr_ss, tr_rs)
+    """
+    rho_A = rho_B = 0
+    n_A = n_B = 0
+    for X, Y in chunks:
+        states = feature_states(featmap, pars, X, n_inp)
+        in_A = np.asarray(Y) == label_A
+        rho_A = rho_A + states[in_A].T @ states[in_A].conj()
+        rho_B = rho_B + states[~in_A].T @ states[~in_A].conj()
+        n_A += np.count_nonzero(in_A)
+        n_B += np.count_nonzero(~in_A)
+
+    tr_rr = np.real(np.sum(rho_A * rho_A.T)) / n_A**2
+    tr_ss = np.real(np.sum(rho_B * rho_B.T)) / n_B**2
+    tr_rs = np.real(np.sum(rho_A * rho_B.T)) / (n_A * n_B)
+    return tr_rr, tr_ss, tr_rs
@@ -0,0 +1,347 @@
+"""
+Landscape
+=========
+
+Scans of the cost landscape of a feature map over grids in the space of its weights.
+
+``objectives()`` returns the HS cost, the overlap cost and the (smooth) empirical risk for a batch of weights
+``axis_directions()`` returns unit vectors along chosen entries of the weights
+``random_directions()`` returns orthonormal directions spanning a random subspace
+``grid_points()`` returns the weights of all points of a grid center + sum_i t_i * direction_i
+``scan()`` evaluates the objectives on a grid in chunks, writing them to a landscape directory
+``load()`` reads a landscape directory
+
+The objectives follow ``embedding_training.ipynb`` and ``risk_function.ipynb``, with
+A the inputs labeled by -1 and B the inputs labeled by 1:
+
+    hs           1 - (- tr_rs + 0.5 * (tr_rr + tr_ss))
+    overlap      tr_rs
+    risk         0.5 - 0.5 * mean(y * sign(overlap_B - overlap_A))
+    smooth_risk  0.5 - 0.5 * mean(y * tanh(len(A) * (overlap_B - overlap_A)))
+
+All of them follow from the Gram matrix of the embedded training inputs. The states of
+a chunk of grid points are computed with ``statevector.batched_feature_states()`` in one
+pass, so each grid point costs one embedding per input instead of a SWAP test per pair.
+
+A landscape directory holds
+
+    spec.json              feature map spec, number of wires, objectives, grid axes
+    center.npy             weights at the origin of the grid
+    directions.npy         directions of the grid axes, of shape (n_axes, n_weights)
+    X.npy, Y.npy           training inputs and labels
+    <objective>.npy        values on the grid, NaN where not evaluated yet
+
+The values are written chunk by chunk as the chunks finish, so an interrupted scan is
+resumed by calling ``scan()`` again with the same directory and settings: finished chunks
+are skipped. Resuming with other settings raises a ValueError.
+
+Usage::
+
+    axes = [np.linspace(-np.pi, np.pi, 101)] * 2
+    scan('landscape', {'name': 'qaoa', 'kwargs': {'n_layers': 2}}, 2, pars, X, Y, axes,
+         directions=random_directions(pars.size, 2, rng=0), n_workers=8)
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import models
+from kernels import fidelities
+from models import build_featmap
+from statevector import batched_feature_states
+
+
+FORMAT = 'variational-embedding-landscape'
+SPEC = 'spec.json'
+
+OBJECTIVES = ('hs', 'overlap', 'risk', 'smooth_risk')
+
+
+def objectives(featmap, pars, A, B, n_inp, names=OBJECTIVES):
+    """
+    Computes the objectives for a batch of weights.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: array of weights with a leading axis of P sets
+    :param A: array of inputs labeled by -1
+    :param B: array of inputs labeled by 1
+    :param n_inp: number of wires the feature map acts on
+    :param names: names of the objectives, of ``OBJECTIVES``
+    :return: dict of objective name -> array of shape (P,)
+    """
+    unknown = set(names) - set(OBJECTIVES)
+    if unknown:
+        raise ValueError("Unknown objectives {}, use some of {}.".format(sorted(unknown), OBJECTIVES))
+    states = batched_feature_states(featmap, pars, np.concatenate([A, B]), n_inp)
+    SA, SB = states[:, :len(A)], states[:, len(A):]
+    # Gram matrices of every set of weights, of shape (P, N1, N2)
+    G_AA = np.stack([fidelities(S) for S in SA])
+    G_BB = np.stack([fidelities(S) for S in SB])
+    G_AB = np.stack([fidelities(S_A, S_B) for S_A, S_B in zip(SA, SB)])
+    tr_rr, tr_ss, tr_rs = G_AA.mean(axis=(1, 2)), G_BB.mean(axis=(1, 2)), G_AB.mean(axis=(1, 2))
+
+    values = {}
+    if 'hs' in names:
+        values['hs'] = 1 - (- tr_rs + 0.5 * (tr_rr + tr_ss))
+    if 'overlap' in names:
+        values['overlap'] = tr_rs
+    if 'risk' in names or 'smooth_risk' in names:
+        # overlap_B - overlap_A of every training input, A first
+        d_A = G_AB.mean(axis=2) - G_AA.mean(axis=2)
+        d_B = G_BB.mean(axis=2) - np.swapaxes(G_AB, 1, 2).mean(axis=2)
+        y = np.concatenate([-np.ones(len(A)), np.ones(len(B))])
+        d = np.concatenate([d_A, d_B], axis=1)
+        if 'risk' in names:
+            values['risk'] = 0.5 - 0.5 * np.mean(y * np.sign(d), axis=1)
+        if 'smooth_risk' in names:
+            values['smooth_risk'] = 0.5 - 0.5 * np.mean(y * np.tanh(len(A) * d), axis=1)
+    return values
+
+
+def axis_directions(n_weights, indices):
+    """
+    Unit vectors along entries of the flattened weights.
+
+    :param n_weights: number of weights
+    :param indices: indices of the entries, one per grid axis
+    :return: array of shape (len(indices), n_weights)
+    """
+    return np.eye(n_weights)[list(indices)]
+
+
+def random_directions(n_weights, n_axes, rng=None):
+    """
+    Orthonormal directions spanning a random subspace of the weights.
+
+    :param n_weights: number of weights
+    :param n_axes: dimension of the subspace
+    :param rng: seed or ``np.random.Generator``
+    :return: array of shape (n_axes, n_weights)
+    """
+    if n_axes > n_weights:
+        raise ValueError("Cannot span {} axes with {} weights.".format(n_axes, n_weights))
+    rng = np.random.default_rng(rng)
+    q, _ = np.linalg.qr(rng.normal(size=(n_weights, n_axes)))
+    return q.T
+
+
+def grid_points(center, directions, axes, start=0, stop=None):
+    """
+    Returns the weights of the points of a grid, in C order of the grid axes.
+
+    :param center: weights at the origin of the grid
+    :param directions: array of shape (n_axes, n_weights)
+    :param axes: list of n_axes arrays with the coordinates along each direction
+    :param start: first flat index of the points to return
+    :param stop: flat index after the last point to return, by default the end of the grid
+    :return: array of shape (stop - start,) + shape of center
+    """
+    center = np.asarray(center, dtype=float)
+    shape = tuple(len(a) for a in axes)
+    stop = int(np.prod(shape)) if stop is None else stop
+    index = np.unravel_index(np.arange(start, stop), shape)
+    coordinates = np.stack([np.asarray(a, dtype=float)[i] for a, i in zip(axes, index)], axis=1)
+    points = center.ravel() + coordinates @ np.asarray(directions, dtype=float)
+    return points.reshape((len(points),) + center.shape)
+
+
+class _Scan:
+    """Opened landscape directory, as used by the processes that evaluate chunks."""
+
+    def __init__(self, path, mmap_mode='r'):
+        with open(os.path.join(path, SPEC)) as f:
+            self.spec = json.load(f)
+        if self.spec.get('format') != FORMAT:
+            raise ValueError("{} is not a landscape directory.".format(path))
+        self.path = path
+        self.featmap = build_featmap(self.spec['featmap'])
+        self.axes = [np.array(a) for a in self.spec['axes']]
+        self.center = np.load(os.path.join(path, 'center.npy'))
+        self.directions = np.load(os.path.join(path, 'directions.npy'))
+        X = np.load(os.path.join(path, 'X.npy'))
+        Y = np.load(os.path.join(path, 'Y.npy'))
+        self.A, self.B = X[Y == -1], X[Y == 1]
+        self.values = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+                       for name in self.spec['objectives']}
+
+    def evaluate(self, start, stop):
+        pars = grid_points(self.center, self.directions, self.axes, start, stop)
+        return start, objectives(self.featmap, pars, self.A, self.B, self.spec['n_wires'],
+                                 self.spec['objectives'])
+
+
+# Landscape opened by a worker process
+_worker = None
+
+
+def _init_worker(path):
+    global _worker
+    _worker = _Scan(path)
+
+
+def _evaluate(start, stop):
+    return _worker.evaluate(start, stop)
+
+
+def _create(path, featmap, n_wires, center, X, Y, axes, directions, names):
+    """Writes the arrays and the spec of a new landscape directory."""
+    build_featmap(featmap)
+    shape = tuple(len(a) for a in axes)
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'center.npy'), np.asarray(center, dtype=float))
+    np.save(os.path.join(path, 'directions.npy'), np.asarray(directions, dtype=float))
+    np.save(os.path.join(path, 'X.npy'), np.asarray(X, dtype=float))
+    np.save(os.path.join(path, 'Y.npy'), np.asarray(Y, dtype=float))
+    for name in names:
+        values = np.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+',
+                                           dtype=float, shape=shape)
+        values[...] = np.nan
+        values.flush()
+        del values
+
+    spec = {'format': FORMAT,
+            'featmap': featmap,
+            'n_wires': n_wires,
+            'objectives': list(names),
+            'axes': [np.asarray(a, dtype=float).tolist() for a in axes]}
+    # The spec is written last and atomically, so that a partially written landscape is never opened
+    tmp = os.path.join(path, SPEC + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(spec, f, indent=2)
+    os.replace(tmp, os.path.join(path, SPEC))
+
+
+def _check(landscape, featmap, n_wires, center, X, Y, axes, directions, names):
+    """Raises a ValueError if a scan does not match the settings of an existing landscape."""
+    spec = landscape.spec
+    arrays = {'center': (landscape.center, center),
+              'directions': (landscape.directions, directions),
+              'X': (np.load(os.path.join(landscape.path, 'X.npy')), X),
+              'Y': (np.load(os.path.join(landscape.path, 'Y.npy')), Y)}
+    changed = [key for key, (stored, given) in arrays.items()
+               if not np.array_equal(stored, np.asarray(given, dtype=float))]
+    if spec['featmap'] != json.loads(json.dumps(featmap)):
+        changed.append('featmap')
+    if spec['n_wires'] != n_wires:
+        changed.append('n_wires')
+    if spec['objectives'] != list(names):
+        changed.append('objectives')
+    if (len(landscape.axes) != len(axes) or
+            not all(np.array_equal(a, np.asarray(b, dtype=float)) for a, b in zip(landscape.axes, axes))):
+        changed.append('axes')
+    if changed:
+        raise ValueError("{} holds a landscape with other {}. Use another directory."
+                         .format(landscape.path, ', '.join(changed)))
+
+
+def scan(path, featmap, n_wires, center, X, Y, axes, directions=None, names=OBJECTIVES,
+         chunk_size=64, n_workers=1, verbose=False):
+    """
+    Evaluates the objectives at the points center + sum_i t_i * directions[i] of a grid,
+    for all coordinates t_i in axes[i], and writes them to a landscape directory.
+
+    If the directory already holds a landscape, its chunks that are not finished are
+    evaluated. The feature map, grid, weights, directions, data and objectives have to be
+    the ones the landscape was created with, otherwise a ValueError is raised.
+
+    :param path: landscape directory
+    :param featmap: spec of the feature map, dict with 'name' and 'kwargs', see ``models``
+    :param n_wires: number of wires the feature map acts on
+    :param center: weights at the origin of the grid
+    :param X: training inputs
+    :param Y: training labels, -1 or 1
+    :param axes: list of arrays with the coordinates along each direction, e.g. two for a 2-D scan
+    :param directions: array of shape (len(axes), center.size), by default the first entries of the weights
+    :param names: names of the objectives, of ``OBJECTIVES``
+    :param chunk_size: number of grid points evaluated together
+    :param n_workers: number of worker processes, None for the number of CPUs; with 1 the
+        chunks are evaluated in this process
+    :param verbose: if True, print the progress
+    :return: dict as returned by ``load()``
+    """
+    unknown = set(names) - set(OBJECTIVES)
+    if unknown:
+        raise ValueError("Unknown objectives {}, use some of {}.".format(sorted(unknown), OBJECTIVES))
+    center = np.asarray(center, dtype=float)
+    if directions is None:
+        directions = axis_directions(center.size, range(len(axes)))
+    if np.shape(directions) != (len(axes), center.size):
+        raise ValueError("Need {} directions of {} weights, got shape {}."
+                         .format(len(axes), center.size, np.shape(directions)))
+    if not os.path.exists(os.path.join(path, SPEC)):
+        _create(path, featmap, n_wires, center, X, Y, axes, directions, names)
+
+    landscape = _Scan(path, mmap_mode='r+')
+    _check(landscape, featmap, n_wires, center, X, Y, axes, directions, names)
+    n_points = int(np.prod([len(a) for a in landscape.axes]))
+    flat = {name: values.reshape(-1) for name, values in landscape.values.items()}
+    pending = [(start, min(start + chunk_size, n_points)) for start in range(0, n_points, chunk_size)
+               if any(np.isnan(v[start:start + chunk_size]).any() for v in flat.values())]
+    if verbose:
+        n_chunks = -(-n_points // chunk_size)
+        print("{} chunks, {} done, {} to run".format(n_chunks, n_chunks - len(pending), len(pending)))
+
+    def write(result):
+        start, values = result
+        for name, value in values.items():
+            flat[name][start:start + len(value)] = value
+        for values in landscape.values.values():
+            values.flush()
+
+    if n_workers == 1:
+        for start, stop in pending:
+            write(landscape.evaluate(start, stop))
+    elif pending:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(path,)) as executor:
+            futures = [executor.submit(_evaluate, start, stop) for start, stop in pending]
+            for done, future in enumerate(as_completed(futures), start=1):
+                write(future.result())
+                if verbose:
+                    print("{}/{} chunks".format(done, len(pending)))
+
+    del landscape, flat
+    return load(path)
+
+
+def load(path):
+    """
+    Reads a landscape directory.
+
+    :param path: landscape directory
+    :return: dict with the 'axes', the 'center', the 'directions' and the 'values', objective
+        name -> array of the grid shape, NaN where not evaluated
+    """
+    landscape = _Scan(path, mmap_mode=None)
+    return {'axes': landscape.axes,
+            'center': landscape.center,
+            'directions': landscape.directions,
+            'values': landscape.values}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scan the cost landscape around the weights of a model.")
+    parser.add_argument('model', help="model directory, see models")
+    parser.add_argument('path', help="landscape directory, resumed if it exists")
+    parser.add_argument('--indices', type=int, nargs='+', default=None,
+                        help="entries of the weights to scan, by default random directions")
+    parser.add_argument('--dims', type=int, default=2, help="number of random directions")
+    parser.add_argument('--radius', type=float, default=np.pi)
+    parser.add_argument('--points', type=int, default=51, help="grid points per axis")
+    parser.add_argument('--objectives', nargs='+', default=list(OBJECTIVES))
+    parser.add_argument('--chunk-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    model = models.load(args.model, mmap_mode=None)
+    if args.indices is None:
+        directions = random_directions(model.pars.size, args.dims, rng=args.seed)
+    else:
+        directions = axis_directions(model.pars.size, args.indices)
+    axes = [np.linspace(-args.radius, args.radius, args.points)] * len(directions)
+    scan(args.path, model.spec['featmap'], model.n_wires, model.pars, model.X, model.Y, axes,
+         directions=directions, names=args.objectives, chunk_size=args.chunk_size,
+         n_workers=args.workers, verbose=True)
@@ -0,0 +1,207 @@
+"""
+Models
+======
+
+Versioned storage of trained feature maps.
+
+``save()`` writes a trained feature map to a model directory
+``load()`` opens a model directory
+``from_legacy()`` converts a settings file of ``embedding_training.ipynb`` to a model directory
+
+A model directory holds
+
+    spec.json     format, version, feature map spec, number of wires, class ranges
+    pars.npy      weights of the feature map
+    X.npy, Y.npy  training inputs and labels, grouped by label
+    states.npy    optional, embedded states of the training inputs for pars
+
+The feature map is stored declaratively as the name of a function in ``featuremaps``
+with its keyword arguments, e.g. {"name": "qaoa", "kwargs": {"n_layers": 2, "circuit_ID": 1}},
+so loading does not unpickle any code. Arrays are only opened when they are first used,
+memory-mapped, and the inputs of each class are a contiguous range of X, so that the
+samples and states of a class are views into the files.
+"""
+import json
+import os
+from functools import partial
+
+import numpy as np
+import featuremaps
+from statevector import feature_states
+
+
+FORMAT = 'variational-embedding-model'
+VERSION = 1
+SPEC = 'spec.json'
+
+
+def build_featmap(spec):
+    """
+    Returns the feature map described by a spec, with signature featmap(weights, x, wires).
+
+    :param spec: dict with the name of a function in ``featuremaps`` and its keyword arguments
+    """
+    featmap = getattr(featuremaps, spec['name'], None)
+    if featmap is None or spec['name'].startswith('_') or spec['name'].startswith('pars'):
+        raise ValueError("Unknown feature map {}.".format(spec['name']))
+    return partial(featmap, **spec.get('kwargs', {}))
+
+
+class Model:
+    """
+    Trained feature map in a model directory, with lazily opened arrays.
+
+    :param path: model directory
+    :param mmap_mode: memory-map mode of ``np.load``, None to read the arrays into memory
+    """
+
+    def __init__(self, path, mmap_mode='r'):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(path, SPEC)) as f:
+            self.spec = json.load(f)
+        if self.spec.get('format') != FORMAT:
+            raise ValueError("{} is not a model directory.".format(path))
+        if self.spec['version'] > VERSION:
+            raise ValueError("Model format version {} is newer than the supported version {}."
+                             .format(self.spec['version'], VERSION))
+        self._arrays = {}
+        self._featmap = None
+
+    def _array(self, name):
+        if name not in self._arrays:
+            path = os.path.join(self.path, name + '.npy')
+            self._arrays[name] = np.load(path, mmap_mode=self.mmap_mode) if os.path.exists(path) else None
+        return self._arrays[name]
+
+    @property
+    def featmap(self):
+        if self._featmap is None:
+            self._featmap = build_featmap(self.spec['featmap'])
+        return self._featmap
+
+    @property
+    def n_wires(self):
+        return self.spec['n_wires']
+
+    @property
+    def step(self):
+        return self.spec.get('step')
+
+    @property
+    def pars(self):
+        return self._array('pars')
+
+    @property
+    def X(self):
+        return self._array('X')
+
+    @property
+    def Y(self):
+        return self._array('Y')
+
+    @property
+    def states(self):
+        """Embedded states of X for pars, or None if they were not stored."""
+        return self._array('states')
+
+    def _range(self, label):
+        start, stop = self.spec['classes'][str(float(label))]
+        return slice(start, stop)
+
+    def samples(self, label):
+        """Training inputs with the given label, a view into X."""
+        return self.X[self._range(label)]
+
+    def class_states(self, label):
+        """Embedded states of the training inputs with the given label, or None."""
+        states = self.states
+        return None if states is None else states[self._range(label)]
+
+
+def load(path, mmap_mode='r'):
+    """
+    Opens a model directory. Arrays are read on first access.
+
+    :param path: model directory
+    :param mmap_mode: memory-map mode of ``np.load``, None to read the arrays into memory
+    :return: ``Model``
+    """
+    return Model(path, mmap_mode=mmap_mode)
+
+
+def is_model(path):
+    """Checks whether a path is a model directory."""
+    return os.path.isfile(os.path.join(path, SPEC))
+
+
+def save(path, featmap, n_wires, pars, X, Y, step=None, with_states=False):
+    """
+    Writes a trained feature map to a model directory.
+
+    :param path: model directory, created if it does not exist
+    :param featmap: spec of the feature map, dict with 'name' and 'kwargs'
+    :param n_wires: number of wires the feature map acts on
+    :param pars: weights of the feature map
+    :param X: training inputs
+    :param Y: training labels
+    :param step: training step of the weights
+    :param with_states: if True, also store the embedded states of the training inputs
+    :return: ``Model`` of the written directory
+    """
+    build_featmap(featmap)
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    if X.ndim == 1:
+        X = X[:, None]
+
+    # Group the inputs by label, largest label first
+    order = np.argsort(-Y, kind='stable')
+    X, Y = X[order], Y[order]
+    labels, starts = np.unique(-Y, return_index=True)
+    stops = list(starts[1:]) + [len(Y)]
+    classes = {str(float(-l)): [int(a), int(b)] for l, a, b in zip(labels, starts, stops)}
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'pars.npy'), np.asarray(pars, dtype=float))
+    np.save(os.path.join(path, 'X.npy'), X)
+    np.save(os.path.join(path, 'Y.npy'), Y)
+    states_path = os.path.join(path, 'states.npy')
+    if with_states:
+        np.save(states_path, feature_states(build_featmap(featmap), pars, X, n_wires))
+    elif os.path.exists(states_path):
+        os.remove(states_path)
+
+    spec = {'format': FORMAT,
+            'version': VERSION,
+            'featmap': featmap,
+            'n_wires': n_wires,
+            'step': step,
+            'classes': classes}
+    # The spec is written last and atomically, so that a partially written model is never opened
+    tmp = os.path.join(path, SPEC + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(spec, f, indent=2)
+    os.replace(tmp, os.path.join(path, SPEC))
+    return load(path)
+
+
+def from_legacy(path_to_featmap, path, name, with_states=False, **kwargs):
+    """
+    Converts a settings file written by ``embedding_training.ipynb`` to a model directory.
+
+    The pickled feature map of the settings file is not loaded. Its spec is given by the
+    name of the function in ``featuremaps`` and its keyword arguments instead; n_layers
+    defaults to the value in the settings file.
+
+    :param path_to_featmap: settings file, a dict saved with ``np.save``
+    :param path: model directory to write
+    :param name: name of the feature map in ``featuremaps``
+    :param with_states: if True, also store the embedded states of the training inputs
+    :param kwargs: keyword arguments of the feature map
+    :return: ``Model`` of the written directory
+    """
+    settings = np.load(path_to_featmap, allow_pickle=True).item()
+    kwargs.setdefault('n_layers', settings['n_layers'])
+    return save(path, {'name': name, 'kwargs': kwargs}, settings['n_wires'], settings['pars'],
+                settings['X'], settings['Y'], step=settings.get('step'), with_states=with_states)
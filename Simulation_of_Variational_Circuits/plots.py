@@ -2,6 +2,7 @@ import matplotlib.pyplot as plt
 #import matplotlib.axes as axes
 import numpy as np
 import pandas
+import sys
 
 def plot_axes_IdVsCost():
 		#axes.Axis.set_axisbelow(True)
@@ -203,6 +204,10 @@ def define_plot_legend(x_Axis,L=None,Nq=None,data_length=None,ID=None):
 
 
 def plotting(data,x_Axis,draw_line=False):
+	# data can also be the path to a results file of sweep.py
+	if isinstance(data, str):
+		from sweep import load_results
+		data = load_results(data)
 	L = len(data)
 	Nq = len(data[0])
 	data_length = len(data[0][0])
@@ -270,7 +275,8 @@ def plotting(data,x_Axis,draw_line=False):
 #plotting(data)
 
 
-plotting(data,x_Axis='ID')
+if __name__ == '__main__':
+	plotting(sys.argv[1] if len(sys.argv) > 1 else data,x_Axis='ID')
 #print(data[1,3,0,:])
 
 	
@@ -0,0 +1,146 @@
+"""
+Shots
+=====
+
+Finite-shot estimates of the overlaps |<phi(x1)|phi(x2)>|^2 measured by the classifier circuits.
+
+``probability()`` returns the probability of the measured outcome for given overlaps
+``estimate_overlaps()`` estimates every overlap of an array from shots repetitions of its circuit
+``estimate_mean_overlap()`` estimates the mean overlap with a class from shots on randomly drawn samples
+``resolve_sign()`` allocates shots between the two classes until the sign of overlap_A - overlap_B is resolved
+
+Two circuits are modelled. The 'swap' test measures the ancilla in |0> with probability
+(1 + F) / 2, the 'overlap' circuit of the fast implementation measures |0..0> with
+probability F. Shots are not simulated one by one. The exact probabilities are computed
+from the embedded states, and the outcome counts of all circuits are drawn with one
+binomial draw. If each shot runs the circuit for a sample drawn at random from a class,
+the number of successes is binomial with the mean probability over the class, so a
+class mean costs one draw as well.
+"""
+import numpy as np
+
+
+CIRCUITS = ('swap', 'overlap')
+
+
+def _check(circuit):
+    if circuit not in CIRCUITS:
+        raise ValueError("Circuit {} not recognized, use one of {}.".format(circuit, CIRCUITS))
+
+
+def probability(overlaps, circuit='swap'):
+    """Probability of the measured outcome of the circuit, for exact overlaps."""
+    _check(circuit)
+    overlaps = np.asarray(overlaps, dtype=float)
+    return 0.5 * (1 + overlaps) if circuit == 'swap' else overlaps
+
+
+def _overlap(p, circuit):
+    """Inverse of ``probability()``."""
+    return 2 * p - 1 if circuit == 'swap' else p
+
+
+def _stderr(p, shots, circuit):
+    """Standard error of the overlap estimated from the outcome frequency p of shots shots."""
+    scale = 2 if circuit == 'swap' else 1
+    return scale * np.sqrt(p * (1 - p) / np.maximum(shots, 1))
+
+
+def estimate_overlaps(overlaps, shots, circuit='swap', rng=None):
+    """
+    Estimates each overlap from shots repetitions of its circuit.
+
+    :param overlaps: array of exact overlaps
+    :param shots: number of shots per circuit, an integer or an array like overlaps
+    :param circuit: 'swap' or 'overlap'
+    :param rng: seed or ``np.random.Generator``
+    :return: tuple of arrays of the estimates and their standard errors
+    """
+    rng = np.random.default_rng(rng)
+    counts = rng.binomial(shots, probability(overlaps, circuit))
+    p = counts / shots
+    return _overlap(p, circuit), _stderr(p, shots, circuit)
+
+
+def estimate_mean_overlap(overlaps, shots, probs=None, circuit='swap', rng=None):
+    """
+    Estimates the mean overlap with a class, where every shot runs the circuit for a
+    sample drawn with the given probabilities.
+
+    :param overlaps: array of exact overlaps with the samples of the class, of shape
+        (n_samples,), or (M, n_samples) for M inputs
+    :param shots: number of shots per input
+    :param probs: probabilities with which the samples are drawn, uniform if None
+    :param circuit: 'swap' or 'overlap'
+    :param rng: seed or ``np.random.Generator``
+    :return: tuple of the estimates and their standard errors, scalars or arrays of shape (M,)
+    """
+    p = probability(overlaps, circuit)
+    mean = np.mean(p, axis=-1) if probs is None else p @ np.asarray(probs, dtype=float)
+    rng = np.random.default_rng(rng)
+    p_hat = rng.binomial(shots, mean) / shots
+    return _overlap(p_hat, circuit), _stderr(p_hat, shots, circuit)
+
+
+def resolve_sign(overlaps_A, overlaps_B, probs_A=None, probs_B=None, circuit='swap',
+                 shots_per_round=64, max_shots=100000, z=3.0, rng=None):
+    """
+    Spends shots on the estimates of overlap_A and overlap_B until the sign of their
+    difference is resolved, |difference| > z * standard error, or max_shots are used.
+
+    Every round distributes shots_per_round shots between the classes in proportion to
+    the standard deviations of their outcomes (Neyman allocation), which minimizes the
+    variance of the difference for a given number of shots.
+
+    :param overlaps_A: exact overlaps with the samples of A, of shape (n_A,) or (M, n_A) for M inputs
+    :param overlaps_B: exact overlaps with the samples of B, of shape (n_B,) or (M, n_B)
+    :param probs_A: probabilities with which the samples of A are drawn, uniform if None
+    :param probs_B: probabilities with which the samples of B are drawn, uniform if None
+    :param circuit: 'swap' or 'overlap'
+    :param shots_per_round: number of shots added per round and input
+    :param max_shots: maximal number of shots per input
+    :param z: number of standard errors that separate the difference from zero
+    :param rng: seed or ``np.random.Generator``
+    :return: dict of arrays 'label' (1 if overlap_A > overlap_B, -1 if smaller, 0 if
+        unresolved), 'difference', 'stderr', 'shots_A', 'shots_B' and 'resolved'
+    """
+    rng = np.random.default_rng(rng)
+    p_A = probability(overlaps_A, circuit)
+    p_B = probability(overlaps_B, circuit)
+    p_A = np.atleast_1d(np.mean(p_A, axis=-1) if probs_A is None else p_A @ np.asarray(probs_A))
+    p_B = np.atleast_1d(np.mean(p_B, axis=-1) if probs_B is None else p_B @ np.asarray(probs_B))
+
+    n = len(p_A)
+    shots = np.zeros((2, n), dtype=np.int64)
+    counts = np.zeros((2, n), dtype=np.int64)
+    active = np.ones(n, dtype=bool)
+    half = max(shots_per_round // 2, 1)
+    allocation = np.full((2, n), half, dtype=np.int64)
+
+    while active.any():
+        counts[0, active] += rng.binomial(allocation[0, active], p_A[active])
+        counts[1, active] += rng.binomial(allocation[1, active], p_B[active])
+        shots[:, active] += allocation[:, active]
+
+        freq = counts / np.maximum(shots, 1)
+        difference = _overlap(freq[0], circuit) - _overlap(freq[1], circuit)
+        # Pseudo-counts keep the standard error away from zero for frequencies of 0 or 1
+        smoothed = (counts + 0.5) / (shots + 1)
+        stderr = np.sqrt(_stderr(smoothed[0], shots[0], circuit)**2 +
+                         _stderr(smoothed[1], shots[1], circuit)**2)
+        resolved = np.abs(difference) > z * stderr
+        active = ~resolved & (shots.sum(axis=0) < max_shots)
+
+        # Neyman allocation of the next round
+        sigma = np.sqrt(smoothed * (1 - smoothed))
+        share = sigma[0] / (sigma[0] + sigma[1])
+        budget = np.minimum(shots_per_round, max_shots - shots.sum(axis=0))
+        allocation[0] = np.clip(np.round(budget * share), 1, np.maximum(budget - 1, 1))
+        allocation[1] = np.maximum(budget - allocation[0], 0)
+
+    return {'label': np.where(resolved, np.sign(difference), 0).astype(int),
+            'difference': difference,
+            'stderr': stderr,
+            'shots_A': shots[0],
+            'shots_B': shots[1],
+            'resolved': resolved}
@@ -0,0 +1,245 @@
+"""
+Simulator
+=========
+
+Pure numpy statevector simulator for a batch of small registers (up to about 10 wires).
+
+``Simulator`` keeps the states of a whole batch of inputs in one preallocated buffer and
+applies the gates used by the feature maps (RX, RY, RZ, CNOT, CZ, CRX, CRY, CRZ, Hadamard,
+Paulis, SWAP, CSWAP) in place. A gate only touches the two halves of the register that
+differ in its target wire, and diagonal and permutation gates are reduced to phases and
+swaps. Gate angles can be scalars or carry a leading batch axis, one angle per state.
+
+The simulator acts on wire positions 0, ..., n_wires-1. Feature maps with the usual
+signature featmap(weights, x, wires) are run on it through ``statevector.feature_states()``.
+"""
+import numpy as np
+
+
+_I = np.eye(2, dtype=complex)
+_X = np.array([[0, 1], [1, 0]], dtype=complex)
+_Y = np.array([[0, -1j], [1j, 0]], dtype=complex)
+_Z = np.array([[1, 0], [0, -1]], dtype=complex)
+_H = np.array([[1, 1], [1, -1]], dtype=complex) / np.sqrt(2)
+
+
+def _rotation(theta, pauli):
+    """Matrix exp(-i theta/2 P), with a leading batch axis if theta is an array."""
+    theta = np.asarray(theta, dtype=float)[..., None, None]
+    return np.cos(theta / 2) * _I - 1j * np.sin(theta / 2) * pauli
+
+
+def _phases(theta):
+    """Diagonal (exp(-i theta/2), exp(i theta/2)) of RZ(theta)."""
+    theta = np.asarray(theta, dtype=float)
+    return np.exp(-0.5j * theta), np.exp(0.5j * theta)
+
+
+# Gate name -> (number of control wires, kind of action on the target wire(s))
+_ACTIONS = {
+    'Hadamard': (0, 'matrix'),
+    'PauliX': (0, 'flip'),
+    'PauliY': (0, 'matrix'),
+    'PauliZ': (0, 'diagonal'),
+    'RX': (0, 'matrix'),
+    'RY': (0, 'matrix'),
+    'RZ': (0, 'diagonal'),
+    'CNOT': (1, 'flip'),
+    'CZ': (1, 'diagonal'),
+    'CRX': (1, 'matrix'),
+    'CRY': (1, 'matrix'),
+    'CRZ': (1, 'diagonal'),
+    'SWAP': (0, 'swap'),
+    'CSWAP': (1, 'swap'),
+    'QubitUnitary': (0, 'unitary'),
+}
+
+# 2x2 matrices of the target actions, as functions of the gate parameters
+_MATRICES = {
+    'Hadamard': lambda: _H,
+    'PauliY': lambda: _Y,
+    'RX': lambda theta: _rotation(theta, _X),
+    'RY': lambda theta: _rotation(theta, _Y),
+    'CRX': lambda theta: _rotation(theta, _X),
+    'CRY': lambda theta: _rotation(theta, _Y),
+}
+
+# Diagonals of the diagonal target actions
+_DIAGONALS = {
+    'PauliZ': lambda: (1, -1),
+    'RZ': _phases,
+    'CZ': lambda: (1, -1),
+    'CRZ': _phases,
+}
+
+# Pauli generator G of each parametrized gate U(theta) = exp(-i theta/2 G), on its target wire
+_GENERATORS = {
+    'RX': 'PauliX',
+    'RY': 'PauliY',
+    'RZ': 'PauliZ',
+    'CRX': 'PauliX',
+    'CRY': 'PauliY',
+    'CRZ': 'PauliZ',
+}
+
+# Names of all supported gates, and of the gates with an angle
+GATES = tuple(_ACTIONS)
+PARAMETRIZED = tuple(_GENERATORS)
+
+
+def _index(axis, value):
+    """Index that selects the given value along one axis of a state tensor."""
+    return (slice(None),) * axis + (value,)
+
+
+def _coefficient(c, ndim):
+    """Reshapes a (batched) gate coefficient to broadcast against a state view with ndim axes."""
+    c = np.asarray(c)
+    return c.reshape(c.shape + (1,) * (ndim - c.ndim))
+
+
+class Simulator:
+    """
+    Batch of statevectors of n_wires qubits, all starting in |0...0>.
+
+    :param n_wires: number of wires of each register
+    :param n_batch: number of registers simulated together
+    """
+
+    def __init__(self, n_wires, n_batch):
+        self.n_wires = n_wires
+        self.n_batch = n_batch
+        self.state = np.empty((n_batch, 2**n_wires), dtype=complex)
+        # Workspace for one full state and for two half states
+        self._work = np.empty_like(self.state)
+        self._scratch = np.empty(max(self.state.size, 2), dtype=complex)
+        self.reset()
+
+    def reset(self):
+        """Sets all registers to |0...0>."""
+        self.state[:] = 0
+        self.state[:, 0] = 1
+
+    def _tensor(self, state):
+        """View of a state buffer with one axis per wire, after the batch axis."""
+        return state.reshape((self.n_batch,) + (2,) * self.n_wires)
+
+    def _temporaries(self, shape):
+        """Two scratch arrays of the given shape."""
+        size = int(np.prod(shape))
+        return (self._scratch[:size].reshape(shape),
+                self._scratch[size:2 * size].reshape(shape))
+
+    def _matrix(self, psi, axis, u):
+        """Applies the 2x2 matrix u to the given axis of the state view psi."""
+        a = psi[_index(axis, 0)]
+        b = psi[_index(axis, 1)]
+        t0, t1 = self._temporaries(a.shape)
+        u00, u01, u10, u11 = (_coefficient(u[..., i, j], a.ndim) for i in (0, 1) for j in (0, 1))
+        np.multiply(a, u00, out=t0)
+        np.multiply(b, u01, out=t1)
+        t0 += t1
+        np.multiply(a, u10, out=t1)
+        b *= u11
+        b += t1
+        a[...] = t0
+
+    def _diagonal(self, psi, axis, d0, d1):
+        """Multiplies the two halves of the given axis of psi by the phases d0 and d1."""
+        a = psi[_index(axis, 0)]
+        b = psi[_index(axis, 1)]
+        if np.any(d0 != 1):
+            a *= _coefficient(d0, a.ndim)
+        b *= _coefficient(d1, b.ndim)
+
+    def _flip(self, psi, axis):
+        """Exchanges the two halves of the given axis of psi."""
+        a = psi[_index(axis, 0)]
+        b = psi[_index(axis, 1)]
+        t0, _ = self._temporaries(a.shape)
+        t0[...] = a
+        a[...] = b
+        b[...] = t0
+
+    def _swap(self, psi, axis1, axis2):
+        """Exchanges the values of two axes of psi."""
+        first, second = sorted((axis1, axis2))
+        a = psi[_index(first, 0) + (slice(None),) * (second - first - 1) + (1,)]
+        b = psi[_index(first, 1) + (slice(None),) * (second - first - 1) + (0,)]
+        t0, _ = self._temporaries(a.shape)
+        t0[...] = a
+        a[...] = b
+        b[...] = t0
+
+    def apply(self, name, wires, params=(), inverse=False, state=None):
+        """
+        Applies a gate in place.
+
+        :param name: name of the gate, one of ``GATES``
+        :param wires: positions of the wires the gate acts on, controls first
+        :param params: gate parameters, angles can carry a leading batch axis
+        :param inverse: if True, apply the inverse of the gate
+        :param state: buffer of shape (n_batch, 2**n_wires) to act on, defaults to self.state
+        """
+        if name not in _ACTIONS:
+            raise ValueError("Gate {} is not supported by the simulator.".format(name))
+        state = self.state if state is None else state
+        psi = self._tensor(state)
+        n_controls, action = _ACTIONS[name]
+
+        if inverse and name in _GENERATORS:
+            params = tuple(-np.asarray(p, dtype=float) for p in params)
+
+        if action == 'unitary':
+            u = np.asarray(params[0], dtype=complex)
+            u = np.conj(u.T) if inverse else u
+            k = len(wires)
+            moved = np.moveaxis(psi, [w + 1 for w in wires], range(-k, 0))
+            shape = moved.shape
+            moved = (moved.reshape(self.n_batch, -1, 2**k) @ u.T).reshape(shape)
+            psi[...] = np.moveaxis(moved, range(-k, 0), [w + 1 for w in wires])
+            return
+
+        # Restrict to the subspace in which all controls are |1>
+        axes = [w + 1 for w in wires]
+        for c in sorted(axes[:n_controls], reverse=True):
+            psi = psi[_index(c, 1)]
+            axes = [a - (a > c) for a in axes]
+        targets = axes[n_controls:]
+
+        if action == 'matrix':
+            self._matrix(psi, targets[0], _MATRICES[name](*params))
+        elif action == 'diagonal':
+            self._diagonal(psi, targets[0], *_DIAGONALS[name](*params))
+        elif action == 'flip':
+            self._flip(psi, targets[0])
+        else:
+            self._swap(psi, targets[0], targets[1])
+
+    def run(self, program):
+        """
+        Applies a sequence of gates (name, wires, params) to the registers.
+
+        :return: the state buffer of shape (n_batch, 2**n_wires)
+        """
+        for name, wires, params in program:
+            self.apply(name, wires, params)
+        return self.state
+
+    def generator_overlap(self, bra, ket, name, wires):
+        """
+        Computes \\sum_n <bra_n|G|ket_n> for the generator G of a parametrized gate,
+        where G is the Pauli on the target wire, projected onto |1> of the control wire
+        for controlled gates.
+
+        :param bra: state buffer of shape (n_batch, 2**n_wires)
+        :param ket: state buffer of shape (n_batch, 2**n_wires)
+        """
+        n_controls, _ = _ACTIONS[name]
+        work = self._work
+        work[...] = ket
+        psi = self._tensor(work)
+        for c in wires[:n_controls]:
+            psi[_index(c + 1, 0)] = 0
+        self.apply(_GENERATORS[name], wires[n_controls:], state=work)
+        return np.vdot(bra, work)
@@ -0,0 +1,472 @@
+"""
+Statevector engine
+==================
+
+Simulates a feature map on a whole block of inputs at once.
+
+``feature_states()`` returns the embedded states of an (N, d) block of inputs as an (N, 2**n) array
+``batched_feature_states()`` returns the states for P sets of weights and N inputs as a (P, N, 2**n) array
+``feature_states_vjp()`` additionally returns a function that pulls gradients back to the weights
+``feature_program()`` returns the gates of the feature map for a block of inputs
+``weight_jacobian()`` returns the derivatives of the gate angles with respect to the weights
+``inverse_program()`` returns the gates of the inverse circuit
+``pair_overlaps()`` returns |<phi(x2)|phi(x1)>|^2 for pairs of inputs from the "overlap with 0" circuit
+``pair_overlaps_vjp()`` additionally returns a function that pulls gradients back to the weights
+
+The feature map is compiled once per wires, weight shape and input dimension into a flat,
+array-backed tape. For every gate, the tape holds its kind, the wires it acts on, and the
+slot its angle is read from: a feature of the input, a weight or a constant, together with
+an affine scale and offset (as in RZ(2*w)). Compiled tapes are cached, so that later calls
+only gather the angles from the inputs and weights and apply the gates on the numpy
+backend in ``simulator``, or compose them in closed form with ``su2`` for a single wire.
+
+Feature maps whose gate angles are not of this form (e.g. RX(x[0]*x[1])) are recorded anew
+on every call instead, with the inputs stacked along a batch axis, so that ``x[i]`` inside
+the feature map is the column of all N values of feature i.
+
+A compiled tape reads the weights from slots as well, so P sets of weights are simulated
+together with N inputs as one batch of P*N circuits, without recording the feature map
+for each set of weights.
+"""
+import weakref
+from collections import namedtuple
+
+import numpy as np
+import pennylane as qml
+from simulator import Simulator, GATES, PARAMETRIZED
+import su2
+import instrumentation
+
+
+# Gates that can be compiled, indexed by their code in a tape
+_KINDS = [name for name in GATES if name != 'QubitUnitary']
+
+# Codes of the slot a gate angle is read from
+_NONE, _CONST, _DATA, _WEIGHT = 0, 1, 2, 3
+
+Tape = namedtuple('Tape', ['kinds', 'wires', 'source', 'index', 'scale', 'offset'])
+Tape.__doc__ = """
+Compiled feature map. Gate k is _KINDS[kinds[k]] acting on the wire positions wires[k]
+(padded with -1), with angle scale[k] * slot + offset[k], where the slot is given by
+source[k] and index[k]: feature index[k] of the input, or entry index[k] of the flattened
+weights.
+"""
+
+# Compiled tapes per feature map, keyed by wires, weight shape and input shape
+_tapes = weakref.WeakKeyDictionary()
+
+
+def _record(featmap, pars, X, wires):
+    """
+    Records the gates that the feature map applies to a block of inputs.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param X: array of inputs of shape (N, d), or (N,) for feature maps with scalar input
+    :param wires: wires on which the feature map acts
+    :return: list of operations, whose parameters carry a leading batch axis of size N
+        if they depend on the input
+    """
+    x = np.asarray(X, dtype=float).T
+    instrumentation.count('recordings')
+    with instrumentation.phase('record'), qml.tape.QuantumTape() as tape:
+        featmap(pars, x, wires)
+    return tape.operations
+
+
+def _angles(ops, n_batch):
+    """Returns the angles of the parametrized gates as an array of shape (n_batch, n_gates)."""
+    return np.array([np.broadcast_to(np.ravel(op.parameters[0]), (n_batch,))
+                     for op in ops if op.name in PARAMETRIZED]).reshape(-1, n_batch).T
+
+
+def _compile(featmap, pars, X, wires):
+    """
+    Compiles the feature map into a tape, by recording it for a few probe inputs and weights.
+
+    :return: the compiled tape, or None if the feature map cannot be expressed as a tape
+    """
+    pars = np.asarray(pars, dtype=float)
+    X = np.asarray(X, dtype=float)
+    d = X.shape[1] if X.ndim == 2 else 1
+    n_weights = pars.size
+    position = {w: i for i, w in enumerate(wires)}
+    rng = np.random.default_rng(0)
+
+    def probe(w, x):
+        x = x if X.ndim == 2 else x[:, 0]
+        return _record(featmap, w.reshape(pars.shape), x, wires)
+
+    # Probe inputs: zero, all unit vectors and a random input for the final check
+    x_probe = np.vstack([np.zeros(d), np.eye(d)])
+    ops = probe(np.zeros(n_weights), x_probe)
+    if any(op.name not in _KINDS for op in ops):
+        return None
+    zero = _angles(ops, d + 1)
+    offset = zero[0]
+    data_coef = zero[1:] - offset
+
+    weight_coef = np.empty((n_weights, len(offset)))
+    for j, w in enumerate(np.eye(n_weights)):
+        weight_coef[j] = _angles(probe(w, x_probe[:1]), 1)[0] - offset
+
+    # Every angle may read from at most one slot
+    uses_data = ~np.isclose(data_coef, 0)
+    uses_weight = ~np.isclose(weight_coef, 0)
+    if np.any(uses_data.sum(axis=0) + uses_weight.sum(axis=0) > 1):
+        return None
+
+    kinds = np.array([_KINDS.index(op.name) for op in ops], dtype=np.int8)
+    op_wires = np.full((len(ops), 3), -1, dtype=np.int16)
+    for k, op in enumerate(ops):
+        op_wires[k, :len(op.wires)] = [position[w] for w in op.wires]
+    parametrized = np.array([op.name in PARAMETRIZED for op in ops], dtype=bool)
+
+    n_ops = len(ops)
+    source = np.full(n_ops, _NONE, dtype=np.int8)
+    index = np.zeros(n_ops, dtype=np.int32)
+    scale = np.zeros(n_ops)
+    full_offset = np.zeros(n_ops)
+    gate = np.flatnonzero(parametrized)
+    source[gate] = _CONST
+    full_offset[gate] = offset
+    for k, g in enumerate(gate):
+        if uses_data[:, k].any():
+            i = np.flatnonzero(uses_data[:, k])[0]
+            source[g], index[g], scale[g] = _DATA, i, data_coef[i, k]
+        elif uses_weight[:, k].any():
+            j = np.flatnonzero(uses_weight[:, k])[0]
+            source[g], index[g], scale[g] = _WEIGHT, j, weight_coef[j, k]
+
+    tape = Tape(kinds, op_wires, source, index, scale, full_offset)
+
+    # Check the compiled tape against a recording at random inputs and weights
+    w_check = rng.uniform(-np.pi, np.pi, size=n_weights)
+    x_check = rng.uniform(-np.pi, np.pi, size=(1, d))
+    ops_check = probe(w_check, x_check)
+    if [op.name for op in ops_check] != [op.name for op in ops]:
+        return None
+    predicted = [np.ravel(params[0])[0] for _, _, params in _program(tape, w_check, x_check) if params]
+    if not np.allclose(predicted, _angles(ops_check, 1)[0]):
+        return None
+
+    return tape
+
+
+def _tape(featmap, pars, X, wires):
+    """Returns the compiled tape of the feature map, compiling it on first use."""
+    key = (tuple(wires), np.shape(pars), np.ndim(X) == 2 and np.shape(X)[1])
+    try:
+        tapes = _tapes.setdefault(featmap, {})
+    except TypeError:
+        # Feature map cannot be weakly referenced, compile without caching
+        return _compile(featmap, pars, X, wires)
+    if key not in tapes:
+        instrumentation.count('compilations')
+        tapes[key] = _compile(featmap, pars, X, wires)
+    return tapes[key]
+
+
+def _program(tape, pars, X):
+    """
+    Interprets a compiled tape for given weights and inputs.
+
+    :return: list of gates (name, wire positions, parameters), where angles that depend on
+        the input carry a leading batch axis
+    """
+    x = np.asarray(X, dtype=float).reshape(len(X), -1)
+    w = np.ravel(np.asarray(pars, dtype=float))
+
+    # Gather all angles at once
+    angles = np.array(tape.offset, dtype=object)
+    weight = tape.source == _WEIGHT
+    angles[weight] = tape.scale[weight] * w[tape.index[weight]] + tape.offset[weight]
+    data = np.flatnonzero(tape.source == _DATA)
+    columns = tape.scale[data] * x[:, tape.index[data]] + tape.offset[data]
+    for k, g in enumerate(data):
+        angles[g] = columns[:, k]
+    return _gates(tape, angles)
+
+
+def _batched_program(tape, pars, X):
+    """
+    Interprets a compiled tape for P sets of weights, of shape (P, n_weights), and N inputs.
+
+    :return: list of gates as in ``_program()``, where angles that depend on the weights or
+        the input carry a leading batch axis of size P*N, running over the inputs first
+    """
+    x = np.asarray(X, dtype=float).reshape(len(X), -1)
+    n_sets, n_inputs = len(pars), len(x)
+
+    angles = np.array(tape.offset, dtype=object)
+    weight = np.flatnonzero(tape.source == _WEIGHT)
+    columns = tape.scale[weight] * pars[:, tape.index[weight]] + tape.offset[weight]
+    for k, g in enumerate(weight):
+        angles[g] = np.repeat(columns[:, k], n_inputs)
+    data = np.flatnonzero(tape.source == _DATA)
+    columns = tape.scale[data] * x[:, tape.index[data]] + tape.offset[data]
+    for k, g in enumerate(data):
+        angles[g] = np.tile(columns[:, k], n_sets)
+    return _gates(tape, angles)
+
+
+def _gates(tape, angles):
+    """Pairs the gates of a compiled tape with their gathered angles."""
+    program = []
+    for k in range(len(tape.kinds)):
+        wires = tape.wires[k]
+        params = () if tape.source[k] == _NONE else (angles[k],)
+        program.append((_KINDS[tape.kinds[k]], [int(i) for i in wires[wires >= 0]], params))
+    return program
+
+
+def _recorded_program(featmap, pars, X, wires):
+    """Records the feature map and returns its gates in the same form as ``_program()``."""
+    position = {w: i for i, w in enumerate(wires)}
+    return [(op.name, [position[w] for w in op.wires], tuple(op.parameters))
+            for op in _record(featmap, pars, X, wires)]
+
+
+def _simulate(program, n_wires, n_batch):
+    """
+    Applies the gates of a program to n_batch copies of |0...0>.
+
+    :return: array of statevectors of shape (n_batch, 2**n_wires)
+    """
+    instrumentation.count('circuits', n_batch)
+    instrumentation.count('gates', len(program) * n_batch)
+    with instrumentation.phase('simulate'):
+        if n_wires == 1 and su2.supports(program):
+            return su2.states(program, n_batch)
+        return Simulator(n_wires, n_batch).run(program)
+
+
+def feature_states(featmap, pars, X, n_inp):
+    """
+    Computes the states |phi(x)> the feature map produces for all inputs x in X.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param X: array of inputs of shape (N, d), or (N,) for feature maps with scalar input
+    :param n_inp: number of wires the feature map acts on
+    :return: complex array of shape (N, 2**n_inp), one statevector per row
+    """
+    return _simulate(feature_program(featmap, pars, X, n_inp), n_inp, len(X))
+
+
+def batched_feature_states(featmap, pars, X, n_inp):
+    """
+    Computes the states |phi(x)> the feature map produces for every set of weights in pars
+    and every input x in X. Compiled feature maps are simulated in one pass over a batch
+    of P*N circuits, other feature maps are recorded once per set of weights.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: array of weights with a leading axis of P sets, of shape (P,) + weight shape
+    :param X: array of inputs of shape (N, d), or (N,) for feature maps with scalar input
+    :param n_inp: number of wires the feature map acts on
+    :return: complex array of shape (P, N, 2**n_inp)
+    """
+    pars = np.asarray(pars, dtype=float)
+    n_sets, n_inputs = len(pars), len(X)
+    wires = list(range(n_inp))
+    tape = _tape(featmap, pars[0], X, wires)
+    if tape is None:
+        return np.stack([feature_states(featmap, p, X, n_inp) for p in pars])
+    program = _batched_program(tape, pars.reshape(n_sets, -1), X)
+    return _simulate(program, n_inp, n_sets * n_inputs).reshape(n_sets, n_inputs, -1)
+
+
+def feature_program(featmap, pars, X, n_inp):
+    """
+    Returns the gates the feature map applies to all inputs x in X.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param X: array of inputs of shape (N, d), or (N,) for feature maps with scalar input
+    :param n_inp: number of wires the feature map acts on
+    :return: list of gates (name, wire positions, parameters), where angles that depend on
+        the input carry a leading batch axis of size N
+    """
+    wires = list(range(n_inp))
+    tape = _tape(featmap, pars, X, wires)
+    if tape is None:
+        return _recorded_program(featmap, pars, X, wires)
+    return _program(tape, pars, X)
+
+
+def _weight_jacobian(featmap, pars, X, wires):
+    """
+    Computes the derivatives of the angles of the parametrized gates with respect to the
+    weights, for feature maps without a compiled tape. The angles have to be affine
+    functions of the weights, such as w or 2*w, with coefficients that do not depend on
+    the input. Both are checked at every input of X.
+
+    :return: array of shape (number of parametrized gates, number of weights)
+    """
+    pars = np.asarray(pars, dtype=float)
+    X = np.asarray(X, dtype=float)
+    weights = np.eye(pars.size)
+
+    def angles(w):
+        return _angles(_record(featmap, w.reshape(pars.shape), X, wires), len(X))
+
+    offset = angles(np.zeros(pars.size))
+    # Derivatives per input, of shape (N, number of gates, number of weights)
+    jac = np.stack([angles(w) - offset for w in weights], axis=-1).reshape(len(X), -1, pars.size)
+
+    if not np.allclose(offset + jac @ pars.ravel(), angles(pars.ravel())):
+        raise ValueError("Gate parameters of the feature map have to be affine functions of the weights.")
+    if not np.allclose(jac, jac[:1]):
+        raise ValueError("Derivatives of the gate parameters with respect to the weights must not "
+                         "depend on the input, as in RY(w * x[0]).")
+
+    return jac[0]
+
+
+def _tape_jacobian(tape, n_weights):
+    """Reads the derivatives of the gate angles with respect to the weights off a tape."""
+    gate = np.flatnonzero(tape.source != _NONE)
+    jac = np.zeros((len(gate), n_weights))
+    weight = tape.source[gate] == _WEIGHT
+    jac[np.flatnonzero(weight), tape.index[gate[weight]]] = tape.scale[gate[weight]]
+    return jac
+
+
+def weight_jacobian(featmap, pars, X, n_inp):
+    """
+    Computes the derivatives of the angles of the parametrized gates of the feature map,
+    in the order of ``feature_program()``, with respect to the flattened weights.
+
+    :return: array of shape (number of parametrized gates, number of weights)
+    """
+    wires = list(range(n_inp))
+    tape = _tape(featmap, pars, X, wires)
+    if tape is None:
+        return _weight_jacobian(featmap, pars, X, wires)
+    return _tape_jacobian(tape, np.size(pars))
+
+
+def _adjoint(program, n_wires, states, adjoints):
+    """
+    Computes the derivatives of a real function C of the final states with respect to
+    the angles of all parametrized gates, with the adjoint method.
+
+    The function C enters through adjoints = dC/d<psi|, so that dC = 2 Re <adjoints|dpsi>.
+    The states are swept back through the circuit once, together with the adjoints.
+
+    :return: array with one derivative per parametrized gate, summed over the batch
+    """
+    sim = Simulator(n_wires, len(states))
+    psi = np.array(states, dtype=complex)
+    lam = np.array(adjoints, dtype=complex)
+    # Both sweeps apply every gate once more
+    instrumentation.count('gates', 2 * len(program) * len(states))
+
+    grads = []
+    with instrumentation.phase('gradient'):
+        for name, wires, params in reversed(program):
+            if name in PARAMETRIZED:
+                # dU/dtheta = -i/2 G U, hence dC/dtheta = 2 Re <lam|-i/2 G psi> = Im <lam|G psi>
+                grads.append(sim.generator_overlap(lam, psi, name, wires).imag)
+            sim.apply(name, wires, params, inverse=True, state=psi)
+            sim.apply(name, wires, params, inverse=True, state=lam)
+
+    return np.array(grads[::-1])
+
+
+def feature_states_vjp(featmap, pars, X, n_inp):
+    """
+    Computes the states the feature map produces for all inputs x in X, together with
+    the vector-Jacobian product with respect to the weights.
+
+    The returned function takes adjoints = dC/d<phi(x)| of shape (N, 2**n_inp) for a
+    real function C of the states, and returns dC/dweights in the shape of pars.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param X: array of inputs of shape (N, d), or (N,) for feature maps with scalar input
+    :param n_inp: number of wires the feature map acts on
+    :return: tuple of the state array of shape (N, 2**n_inp) and the vjp function
+    """
+    program = feature_program(featmap, pars, X, n_inp)
+    states = _simulate(program, n_inp, len(X))
+    jac = weight_jacobian(featmap, pars, X, n_inp)
+
+    def vjp(adjoints):
+        return (jac.T @ _adjoint(program, n_inp, states, adjoints)).reshape(np.shape(pars))
+
+    return states, vjp
+
+
+def inverse_program(program):
+    """
+    Returns the gates of the inverse circuit: the gates in reverse order, rotations with
+    negated angles and QubitUnitary with the adjoint matrix. All other supported gates
+    are their own inverse.
+
+    :param program: list of gates (name, wire positions, parameters)
+    :return: list of gates of the same form
+    """
+    inverse = []
+    for name, wires, params in reversed(program):
+        if name in PARAMETRIZED:
+            params = tuple(-np.asarray(p, dtype=float) for p in params)
+        elif name == 'QubitUnitary':
+            params = (np.swapaxes(np.conj(params[0]), -1, -2),)
+        inverse.append((name, wires, params))
+    return inverse
+
+
+def _pair_program(featmap, pars, X1, X2, n_inp):
+    """Gates of U(x2)^dagger U(x1) for all pairs of rows of X1 and X2."""
+    if len(X1) != len(X2) and len(X2) != 1:
+        raise ValueError("X2 has to have the length of X1 or length 1, got {} and {}."
+                         .format(len(X1), len(X2)))
+    return (feature_program(featmap, pars, X1, n_inp) +
+            inverse_program(feature_program(featmap, pars, X2, n_inp)))
+
+
+def pair_overlaps(featmap, pars, X1, X2, n_inp):
+    """
+    Computes |<phi(x2)|phi(x1)>|^2 for all pairs of rows x1, x2 of X1 and X2 with the
+    "overlap with 0" circuit: U(x1) followed by the inverse embedding U(x2)^dagger, on
+    n_inp wires only. The overlap is the squared amplitude of |0...0> in the final state.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param X1: array of inputs of shape (N, d)
+    :param X2: array of inputs of shape (N, d), or (1, d) to pair every row of X1 with one input
+    :param n_inp: number of wires the feature map acts on
+    :return: array of shape (N,)
+    """
+    program = _pair_program(featmap, pars, X1, X2, n_inp)
+    amplitudes = _simulate(program, n_inp, len(X1))[:, 0]
+    return np.abs(amplitudes) ** 2
+
+
+def pair_overlaps_vjp(featmap, pars, X1, X2, n_inp):
+    """
+    Computes the overlaps of ``pair_overlaps()`` together with the vector-Jacobian product
+    with respect to the weights. Each pair costs one forward and one backward sweep
+    through the overlap circuit.
+
+    The returned function takes the derivatives dC/d(overlap) of a real function C of
+    the overlaps, an array of shape (N,), and returns dC/dweights in the shape of pars.
+
+    :return: tuple of the overlaps of shape (N,) and the vjp function
+    """
+    program = _pair_program(featmap, pars, X1, X2, n_inp)
+    states = _simulate(program, n_inp, len(X1))
+    amplitudes = states[:, 0]
+
+    # The inverse embedding reads the same angles in reverse order, negated
+    jac = weight_jacobian(featmap, pars, np.concatenate([X1, X2]), n_inp)
+    jac = np.vstack([jac, -jac[::-1]])
+
+    def vjp(cotangents):
+        # d|<0|psi>|^2/d<psi| = |0><0|psi>
+        adjoints = np.zeros_like(states)
+        adjoints[:, 0] = np.asarray(cotangents) * amplitudes
+        return (jac.T @ _adjoint(program, n_inp, states, adjoints)).reshape(np.shape(pars))
+
+    return np.abs(amplitudes) ** 2, vjp
@@ -0,0 +1,173 @@
+"""
+Single-qubit fast path
+======================
+
+Closed-form treatment of feature maps that act on a single wire.
+
+``supports()`` checks whether a program only contains single-qubit gates
+``compose()`` composes all gates into one SU(2) element per input
+``compose_with_derivatives()`` additionally returns the derivatives with respect to all gate angles
+``states()`` returns the embedded states U|0>
+``bloch_vectors()`` returns the Bloch vectors of the embedded states
+
+A single-qubit unitary is stored, up to a global phase, as a unit quaternion (w, x, y, z)
+with U = w I - i (x X + y Y + z Z). The quaternions of all inputs are multiplied together
+with elementwise numpy operations, and runs of gates that do not depend on the input are
+fused into one quaternion before they touch the batch. The overlap of two embedded states
+follows from their Bloch vectors r1, r2 as |<phi_1|phi_2>|^2 = (1 + r1.r2) / 2.
+"""
+import numpy as np
+
+
+_SQRT_HALF = np.sqrt(0.5)
+
+# Fixed gates as (global phase, quaternion)
+_FIXED = {
+    'Hadamard': (1j, np.array([0, _SQRT_HALF, 0, _SQRT_HALF])),
+    'PauliX': (1j, np.array([0., 1, 0, 0])),
+    'PauliY': (1j, np.array([0., 0, 1, 0])),
+    'PauliZ': (1j, np.array([0., 0, 0, 1])),
+}
+
+# Rotation axis of the rotation gates
+_AXES = {'RX': 1, 'RY': 2, 'RZ': 3}
+
+_IDENTITY = np.array([1., 0, 0, 0])
+
+
+def supports(program):
+    """Checks whether the program only contains gates with a quaternion representation."""
+    return all(name in _FIXED or name in _AXES for name, _, _ in program)
+
+
+def _rotation(name, theta):
+    """Quaternion of a rotation gate, of shape (4,) or (4, N) for batched angles."""
+    theta = np.asarray(theta, dtype=float)
+    q = np.zeros((4,) + theta.shape)
+    q[0] = np.cos(theta / 2)
+    q[_AXES[name]] = np.sin(theta / 2)
+    return q
+
+
+def _rotation_derivative(name, theta):
+    """Derivative of the quaternion of a rotation gate with respect to its angle."""
+    theta = np.asarray(theta, dtype=float)
+    dq = np.zeros((4,) + theta.shape)
+    dq[0] = -0.5 * np.sin(theta / 2)
+    dq[_AXES[name]] = 0.5 * np.cos(theta / 2)
+    return dq
+
+
+def _multiply(q1, q2):
+    """Quaternion of the product U1 U2, broadcasting over trailing batch axes."""
+    w1, x1, y1, z1 = q1
+    w2, x2, y2, z2 = q2
+    return np.array([w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+                     w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+                     w1 * y2 + y1 * w2 + z1 * x2 - x1 * z2,
+                     w1 * z2 + z1 * w2 + x1 * y2 - y1 * x2])
+
+
+def _gate(name, params):
+    """Global phase and quaternion of a gate."""
+    if name in _FIXED:
+        return _FIXED[name]
+    return 1, _rotation(name, params[0])
+
+
+def compose(program, n_batch):
+    """
+    Composes the gates of a single-wire program into one unitary per input.
+
+    :param program: list of gates (name, wires, params), with angles that are scalars or
+        carry a leading batch axis
+    :param n_batch: number of inputs
+    :return: tuple of the global phase and the quaternions, an array of shape (4, n_batch)
+    """
+    phase = 1
+    q = np.broadcast_to(_IDENTITY[:, None], (4, n_batch))
+    pending = _IDENTITY
+    for name, _, params in program:
+        p, g = _gate(name, params)
+        phase *= p
+        if g.ndim == 1:
+            # Fuse gates that are the same for all inputs
+            pending = _multiply(g, pending)
+        else:
+            q = _multiply(g, _multiply(pending[:, None], q))
+            pending = _IDENTITY
+    q = _multiply(pending[:, None], q)
+    return phase, np.broadcast_to(q, (4, n_batch))
+
+
+def compose_with_derivatives(program, n_batch):
+    """
+    Composes the gates of a single-wire program, together with the derivatives of the
+    product with respect to the angles of all rotation gates,
+
+        dU/dtheta_k = (U_K ... U_{k+1}) dU_k/dtheta_k (U_{k-1} ... U_1).
+
+    :return: tuple of the global phase, the quaternions of shape (4, n_batch) and their
+        derivatives of shape (number of rotation gates, 4, n_batch)
+    """
+    phase = 1
+    gates = []
+    derivatives = []
+    for name, _, params in program:
+        p, g = _gate(name, params)
+        phase *= p
+        gates.append(np.broadcast_to(g.reshape(4, -1), (4, n_batch)))
+        derivatives.append(None if name in _FIXED else
+                           np.broadcast_to(_rotation_derivative(name, params[0]).reshape(4, -1), (4, n_batch)))
+
+    # Products of all gates before and after each gate
+    prefix = [np.broadcast_to(_IDENTITY[:, None], (4, n_batch))]
+    for g in gates[:-1]:
+        prefix.append(_multiply(g, prefix[-1]))
+    suffix = [np.broadcast_to(_IDENTITY[:, None], (4, n_batch))]
+    for g in gates[:0:-1]:
+        suffix.append(_multiply(suffix[-1], g))
+    suffix = suffix[::-1]
+
+    q = _multiply(gates[-1], prefix[-1]) if gates else prefix[0]
+    dq = np.array([_multiply(suffix[k], _multiply(dg, prefix[k]))
+                   for k, dg in enumerate(derivatives) if dg is not None]).reshape(-1, 4, n_batch)
+    return phase, q, dq
+
+
+def states(program, n_batch):
+    """
+    Computes the states U|0> of a single-wire program for all inputs.
+
+    :return: complex array of shape (n_batch, 2)
+    """
+    phase, (w, x, y, z) = compose(program, n_batch)
+    return phase * np.stack([w - 1j * z, y - 1j * x], axis=1)
+
+
+def bloch_vectors(q):
+    """
+    Computes the Bloch vectors of the states U|0> from the quaternions of U.
+
+    :param q: array of quaternions of shape (4, N)
+    :return: array of shape (N, 3)
+    """
+    w, x, y, z = q
+    return np.stack([2 * (w * y + x * z),
+                     2 * (y * z - w * x),
+                     w**2 + z**2 - x**2 - y**2], axis=1)
+
+
+def bloch_derivatives(q, dq):
+    """
+    Computes the derivatives of the Bloch vectors from the derivatives of the quaternions.
+
+    :param q: array of quaternions of shape (4, N)
+    :param dq: array of derivatives of shape (K, 4, N)
+    :return: array of shape (K, N, 3)
+    """
+    w, x, y, z = q
+    dw, dx, dy, dz = np.moveaxis(dq, 1, 0)
+    return 2 * np.stack([w * dy + y * dw + x * dz + z * dx,
+                         y * dz + z * dy - w * dx - x * dw,
+                         w * dw + z * dz - x * dx - y * dy], axis=2)
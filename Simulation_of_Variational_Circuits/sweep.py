@@ -0,0 +1,305 @@
+"""
+Sweep
+=====
+
+Runs the training of ``embedding_training.ipynb`` over a grid of circuits, numbers of
+layers, numbers of wires and data dimensions.
+
+``cells()`` enumerates the grid cells a feature map can be trained on
+``train_cell()`` trains the feature map of one grid cell
+``run_sweep()`` trains all cells of a grid in a process pool, with checkpointing
+``load_results()`` reads a results file into the array data[L, Nq, d, ID] used by ``plots.plotting()``
+
+Every finished cell is appended as one JSON line to the results file, so an interrupted
+sweep is resumed by running it again with the same file: cells already in the file are
+skipped. Each cell draws its random numbers from a seed derived from the base seed and
+the cell itself, so results do not depend on the number of workers or on the order in
+which the cells finish.
+
+Every record holds the training settings it was made with. A results file only holds
+one set of training settings per seed: resuming a sweep with other settings raises a
+ValueError instead of mixing results of different settings.
+
+Usage::
+
+    python sweep.py results.jsonl --workers 64
+"""
+import argparse
+import inspect
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+import numpy as np
+import datasets
+from cost import hs_cost_chunked
+from training import RMSProp, train
+from featuremaps import (qaoa, shallow_circuit, HVA_TFIM_2D_data, HVA_TFIM_1D_data, VQC,
+                         pars_qaoa, pars_HVA, pars_HVA_TFIM_1D_data, pars_VQC)
+
+
+# Circuit ID (the last axis of the plotted data) -> (feature map, keyword arguments)
+CIRCUITS = {
+    1: (qaoa, {'circuit_ID': 1}),
+    2: (qaoa, {'circuit_ID': 2}),
+    3: (shallow_circuit, {'circuit_ID': 18}),
+    4: (shallow_circuit, {'circuit_ID': 19}),
+    5: (HVA_TFIM_2D_data, {'types': 1}),
+    6: (HVA_TFIM_1D_data, {'types': 1}),
+    7: (VQC, {'types': 1}),
+    8: (VQC, {'types': 2}),
+}
+
+# Data dimension -> (features, labels) in ./data
+DATASETS = {
+    1: ('X_1d_sep.txt', 'Y_1d_sep.txt'),
+    2: ('X_2d_sep.txt', 'Y_2d_sep.txt'),
+}
+
+LAYERS = (1, 2, 3, 4)
+WIRES = (1, 2, 3, 4)
+
+
+def supported(circuit_ID, n_layers, n_wires, data_dim):
+    """Checks whether the feature map of a circuit ID can be built for the given sizes."""
+    featmap, _ = CIRCUITS[circuit_ID]
+    if data_dim > n_wires:
+        return False
+    if featmap in (HVA_TFIM_2D_data, HVA_TFIM_1D_data):
+        # The HVA feature maps always act on four wires
+        return n_wires == 4 and (featmap is HVA_TFIM_1D_data or data_dim == 2)
+    return True
+
+
+def cells(circuit_IDs=tuple(CIRCUITS), layers=LAYERS, wires=WIRES, data_dims=tuple(DATASETS)):
+    """
+    Enumerates the supported cells of a grid.
+
+    :return: list of tuples (circuit_ID, n_layers, n_wires, data_dim)
+    """
+    return [(c, l, n, d) for c in circuit_IDs for l in layers for n in wires for d in data_dims
+            if supported(c, l, n, d)]
+
+
+def build_featmap(circuit_ID, n_layers):
+    """Returns the feature map of a circuit ID with signature featmap(weights, x, wires)."""
+    featmap, kwargs = CIRCUITS[circuit_ID]
+    return partial(featmap, n_layers=n_layers, **kwargs)
+
+
+def initial_pars(circuit_ID, n_layers, n_wires, data_dim):
+    """Initial weights of the feature map of a circuit ID, as chosen in the training notebook."""
+    featmap, kwargs = CIRCUITS[circuit_ID]
+    if featmap is HVA_TFIM_2D_data:
+        return pars_HVA(n_layers=n_layers, types=kwargs['types'])
+    if featmap is HVA_TFIM_1D_data:
+        return pars_HVA_TFIM_1D_data(n_layers=n_layers, types=kwargs['types'])
+    if featmap is VQC:
+        return pars_VQC(data_dim, n_wires=n_wires, n_layers=n_layers, types=kwargs['types'])
+    return pars_qaoa(n_wires=n_wires, n_layers=n_layers)
+
+
+def cell_seed(seed, cell):
+    """Seed of a grid cell, derived from the base seed and the cell."""
+    return int(np.random.SeedSequence([seed, *cell]).generate_state(1)[0])
+
+
+# Keyword arguments of ``train_cell()`` that change the trained weights
+TRAINING = ('n_steps', 'batch_size', 'stepsize', 'decay', 'eps')
+
+
+def training_config(**training):
+    """Training settings of ``train_cell()``, with the defaults filled in."""
+    defaults = inspect.signature(train_cell).parameters
+    return {key: training.get(key, defaults[key].default) for key in TRAINING}
+
+
+def _load_data(data_dim, data_dir):
+    path_X, path_Y = DATASETS[data_dim]
+    return datasets.load(os.path.join(data_dir, path_X), os.path.join(data_dir, path_Y))
+
+
+def train_cell(cell, seed=0, n_steps=300, batch_size=1, stepsize=0.01, decay=0.9, eps=1e-8,
+               chunk_size=4096, data_dir='./data'):
+    """
+    Trains the feature map of one grid cell with the Hilbert-Schmidt cost, sampling
+    batch_size inputs of each class per step and updating the weights with RMSProp,
+    see ``training.train()``.
+
+    :param cell: tuple (circuit_ID, n_layers, n_wires, data_dim)
+    :param seed: base seed of the sweep
+    :param n_steps: number of optimization steps
+    :param batch_size: number of inputs of each class per step
+    :param stepsize: learning rate of RMSProp
+    :param decay: decay of the squared gradient average of RMSProp
+    :param eps: regularization of RMSProp
+    :param chunk_size: number of inputs per chunk when evaluating the cost on the whole dataset
+    :param data_dir: folder with the datasets
+    :return: dictionary with the cell, the cost before and after training and the trained weights
+    """
+    circuit_ID, n_layers, n_wires, data_dim = cell
+    start = time.time()
+    # The initial weights of VQC are drawn with np.random
+    np.random.seed(cell_seed(seed, cell))
+    rng = np.random.default_rng(cell_seed(seed, cell))
+
+    X, Y = _load_data(data_dim, data_dir)
+    A = X[Y == -1]
+    B = X[Y == 1]
+
+    featmap = build_featmap(circuit_ID, n_layers)
+    pars = np.array(initial_pars(circuit_ID, n_layers, n_wires, data_dim), dtype=float)
+    init_cost = hs_cost_chunked(featmap, pars, datasets.chunks(X, Y, chunk_size), n_wires)
+
+    pars, _ = train(featmap, pars, A, B, n_wires, n_steps=n_steps, batch_size=batch_size,
+                    optimizer=RMSProp(stepsize=stepsize, decay=decay, eps=eps), rng=rng)
+
+    return {'circuit_ID': circuit_ID,
+            'n_layers': n_layers,
+            'n_wires': n_wires,
+            'data_dim': data_dim,
+            'seed': seed,
+            'n_steps': n_steps,
+            'config': training_config(n_steps=n_steps, batch_size=batch_size, stepsize=stepsize,
+                                      decay=decay, eps=eps),
+            'init_cost': float(init_cost),
+            'cost': float(hs_cost_chunked(featmap, pars, datasets.chunks(X, Y, chunk_size), n_wires)),
+            'pars': pars.tolist(),
+            'time': time.time() - start}
+
+
+def _cell(record):
+    return record['circuit_ID'], record['n_layers'], record['n_wires'], record['data_dim']
+
+
+def read_records(path):
+    """
+    Reads the records of all finished cells of a results file.
+
+    A line that was only partially written before a crash is ignored.
+    """
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def _append(f, record):
+    f.write(json.dumps(record) + '\n')
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def run_sweep(path, grid=None, n_workers=None, seed=0, verbose=True, **training):
+    """
+    Trains all cells of a grid and appends the results to a JSON lines file.
+
+    Cells whose results are already in the file are skipped, so calling this again
+    after an interruption resumes the sweep. If the file holds results of the same seed
+    made with other training settings, a ValueError is raised.
+
+    :param path: results file
+    :param grid: list of cells (circuit_ID, n_layers, n_wires, data_dim), defaults to ``cells()``
+    :param n_workers: number of worker processes, defaults to the number of CPUs;
+        with 1 the cells are trained in this process
+    :param seed: base seed of the sweep
+    :param verbose: if True, print every finished cell
+    :param training: keyword arguments passed on to ``train_cell()``
+    :return: list of the records of all cells of the grid in the file
+    """
+    grid = cells() if grid is None else [tuple(c) for c in grid]
+    config = training_config(**training)
+    records = [r for r in read_records(path) if r.get('seed', seed) == seed]
+    for record in records:
+        # Records written before the settings were stored only know n_steps
+        stored = record.get('config', {'n_steps': record.get('n_steps')})
+        if any(stored[key] != config[key] for key in stored):
+            raise ValueError("{} holds results for seed {} trained with {}, but the sweep runs with {}. "
+                             "Use another results file.".format(path, seed, stored, config))
+    done = {_cell(r) for r in records}
+    pending = [c for c in grid if c not in done]
+    # Convert the text files once before the workers open the datasets
+    data_dir = training.get('data_dir', './data')
+    for data_dim in {c[3] for c in pending}:
+        _load_data(data_dim, data_dir)
+    if verbose:
+        print("{} cells, {} done, {} to run".format(len(grid), len(grid) - len(pending), len(pending)))
+
+    with open(path, 'a') as f:
+        if n_workers == 1:
+            for cell in pending:
+                record = train_cell(cell, seed=seed, **training)
+                _append(f, record)
+                if verbose:
+                    print(cell, record['cost'])
+        elif pending:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                futures = {executor.submit(train_cell, cell, seed=seed, **training): cell
+                           for cell in pending}
+                for future in as_completed(futures):
+                    record = future.result()
+                    _append(f, record)
+                    if verbose:
+                        print(futures[future], record['cost'])
+
+    grid = set(grid)
+    return [r for r in read_records(path) if _cell(r) in grid and r.get('seed', seed) == seed]
+
+
+def load_results(path, shape=(len(LAYERS), len(WIRES), len(DATASETS), len(CIRCUITS)), key='cost',
+                 seed=None):
+    """
+    Reads a results file into the array data[L, Nq, d, ID] of ``plots.plotting()``, with
+    NaN for the cells that were not trained. Axes are indexed by value - 1.
+
+    Only the records of one seed are read. If the file holds several seeds, the seed
+    has to be given, otherwise a ValueError is raised.
+
+    :param path: results file
+    :param shape: shape of the array
+    :param key: which value of the records to fill in
+    :param seed: base seed of the sweep whose records are read, by default the only seed in the file
+    :return: array of the given shape
+    """
+    records = read_records(path)
+    if seed is None:
+        seeds = sorted({record.get('seed', 0) for record in records})
+        if len(seeds) > 1:
+            raise ValueError("{} holds the seeds {}, choose one with seed.".format(path, seeds))
+    else:
+        records = [record for record in records if record.get('seed', 0) == seed]
+
+    data = np.full(shape, np.nan)
+    for record in records:
+        circuit_ID, n_layers, n_wires, data_dim = _cell(record)
+        index = (n_layers - 1, n_wires - 1, data_dim - 1, circuit_ID - 1)
+        if all(i < s for i, s in zip(index, shape)):
+            data[index] = record[key]
+    return data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train feature maps over a grid of settings.")
+    parser.add_argument('path', help="results file, resumed if it exists")
+    parser.add_argument('--ids', type=int, nargs='+', default=list(CIRCUITS))
+    parser.add_argument('--layers', type=int, nargs='+', default=list(LAYERS))
+    parser.add_argument('--wires', type=int, nargs='+', default=list(WIRES))
+    parser.add_argument('--data-dims', type=int, nargs='+', default=list(DATASETS))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--steps', type=int, default=300)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--stepsize', type=float, default=0.01)
+    args = parser.parse_args()
+
+    run_sweep(args.path, cells(args.ids, args.layers, args.wires, args.data_dims),
+              n_workers=args.workers, seed=args.seed, n_steps=args.steps,
+              batch_size=args.batch_size, stepsize=args.stepsize)
@@ -0,0 +1,138 @@
+"""
+Training
+========
+
+Training loop for feature maps, as in ``embedding_training.ipynb``.
+
+``sample_pairs()`` draws the indices of a batch of samples of both classes
+``metrics()`` returns the cost, tr_rr, tr_ss and tr_rs of a feature map from one overlap computation
+``train()`` optimizes the weights of a feature map on batches of samples
+``RMSProp`` is the optimizer used by the notebooks
+
+Batches are index arrays into A and B, and the cost and gradient of a whole batch are
+computed by one call of ``cost.hs_cost_and_grad()`` or ``cost.overlap_cost_and_grad()``,
+which embed every sample once. The logged metrics share one computation of the
+overlaps of the full dataset instead of evaluating the cost and each overlap separately.
+
+The phases 'log', 'cost' and 'optimizer_step' of every step are timed by ``instrumentation``.
+"""
+import numpy as np
+import instrumentation
+from cost import hs_cost_and_grad, overlap_cost_and_grad
+from kernels import class_overlaps
+
+
+# Name -> (cost from the overlaps (tr_rr, tr_ss, tr_rs), cost and gradient)
+COSTS = {
+    'hs': (lambda rr, ss, rs: 1 - (- rs + 0.5 * (ss + rr)), hs_cost_and_grad),
+    'overlap': (lambda rr, ss, rs: rs, overlap_cost_and_grad),
+}
+
+
+class RMSProp:
+    """
+    RMSProp optimizer with the update rule of ``qml.RMSPropOptimizer``,
+
+        a <- decay * a + (1 - decay) * g^2,
+        w <- w - stepsize * g / sqrt(a + eps).
+
+    :param stepsize: learning rate
+    :param decay: decay of the average of the squared gradients
+    :param eps: regularization
+    """
+
+    def __init__(self, stepsize=0.01, decay=0.9, eps=1e-8):
+        self.stepsize = stepsize
+        self.decay = decay
+        self.eps = eps
+        self.accumulation = None
+
+    def step(self, pars, grad):
+        """Returns the weights after one update with the given gradient."""
+        if self.accumulation is None:
+            self.accumulation = np.zeros_like(grad)
+        self.accumulation = self.decay * self.accumulation + (1 - self.decay) * grad**2
+        return pars - self.stepsize * grad / np.sqrt(self.accumulation + self.eps)
+
+
+def sample_pairs(rng, n_A, n_B, batch_size):
+    """
+    Draws batch_size indices of each class, with replacement.
+
+    :param rng: ``np.random.Generator``
+    :param n_A: number of samples of class A
+    :param n_B: number of samples of class B
+    :param batch_size: number of indices per class
+    :return: tuple of index arrays (selectA, selectB)
+    """
+    return rng.integers(n_A, size=batch_size), rng.integers(n_B, size=batch_size)
+
+
+def metrics(featmap, pars, A, B, n_inp, cost='hs'):
+    """
+    Computes the cost and the mean overlaps of a feature map on the given samples.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: weights of the feature map
+    :param A: array of inputs of class A
+    :param B: array of inputs of class B
+    :param n_inp: number of wires the feature map acts on
+    :param cost: name of the cost, one of ``COSTS``
+    :return: dict with the values of 'cost', 'tr_rr', 'tr_ss' and 'tr_rs'
+    """
+    tr_rr, tr_ss, tr_rs = class_overlaps(featmap, pars, A, B, n_inp)
+    return {'cost': COSTS[cost][0](tr_rr, tr_ss, tr_rs), 'tr_rr': tr_rr, 'tr_ss': tr_ss, 'tr_rs': tr_rs}
+
+
+def train(featmap, pars, A, B, n_inp, n_steps=300, batch_size=1, cost='hs', optimizer=None,
+          log_step=None, rng=None, verbose=False):
+    """
+    Optimizes the weights of a feature map, drawing batch_size samples of each class
+    in every step.
+
+    :param featmap: feature map with signature featmap(weights, x, wires)
+    :param pars: initial weights of the feature map
+    :param A: array of inputs of class A
+    :param B: array of inputs of class B
+    :param n_inp: number of wires the feature map acts on
+    :param n_steps: number of optimization steps
+    :param batch_size: number of samples of each class per step
+    :param cost: name of the cost, one of ``COSTS``
+    :param optimizer: object with a method step(pars, grad), defaults to ``RMSProp()``
+    :param log_step: how often the metrics of the full dataset are logged, None for never
+    :param rng: seed or ``np.random.Generator`` for drawing the batches
+    :param verbose: if True, print the logged metrics
+    :return: tuple of the trained weights and the history, a dict of arrays with the
+        logged 'step', 'cost', 'tr_rr', 'tr_ss' and 'tr_rs'
+    """
+    if cost not in COSTS:
+        raise ValueError("Cost {} not recognized, use one of {}.".format(cost, list(COSTS)))
+    cost_and_grad = COSTS[cost][1]
+    optimizer = RMSProp() if optimizer is None else optimizer
+    rng = np.random.default_rng(rng)
+    pars = np.array(pars, dtype=float)
+
+    history = {'step': [], 'cost': [], 'tr_rr': [], 'tr_ss': [], 'tr_rs': []}
+
+    def log(step):
+        with instrumentation.phase('log'):
+            values = metrics(featmap, pars, A, B, n_inp, cost=cost)
+        history['step'].append(step)
+        for key, value in values.items():
+            history[key].append(value)
+        if verbose:
+            print("Step {} -- rs {:2f}-- rr {:2f} -- ss {:2f} -- cst {:2f}"
+                  .format(step, values['tr_rs'], values['tr_rr'], values['tr_ss'], values['cost']))
+
+    for step in range(n_steps):
+        if log_step and step % log_step == 0:
+            log(step)
+        selectA, selectB = sample_pairs(rng, len(A), len(B), batch_size)
+        with instrumentation.phase('cost'):
+            _, grad = cost_and_grad(featmap, pars, A[selectA], B[selectB], n_inp)
+        with instrumentation.phase('optimizer_step'):
+            pars = optimizer.step(pars, grad)
+    if log_step:
+        log(n_steps)
+
+    return pars, {key: np.array(value) for key, value in history.items()}
@@ -0,0 +1,339 @@
+"""
+Benchmark
+=========
+
+Expressivity benchmark of ``random_embedding_circuit()`` over many random gate sequences.
+
+``gate_sequence()`` returns the gate codes of the random gate sequence of a seed, as in ``two-qubit-random-embedding.ipynb``
+``spectrum()`` returns the power of each frequency of the single-qubit Pauli expectations <P>(x)
+``expressibility()`` returns the KL divergence of the distribution of overlaps from the Haar distribution
+``train()`` trains the weights with the Hilbert-Schmidt cost
+``evaluate_seed()`` computes all metrics of the circuit of one seed
+``run_benchmark()`` evaluates many seeds in a process pool and writes a columnar table
+``load_results()`` reads the table
+``settings()`` returns the settings of ``evaluate_seed()`` stored in every row
+
+Every seed gives one gate sequence, the same as ``random_gate_sequence()`` after
+np.random.seed(seed) in the notebook, and one row of the table. Gate sequences are
+handled as uint8 gate codes, see ``random_gate_codes()``. The table is a .npz file
+with one array per column, and the first axis of each array runs over the seeds,
+e.g. 'gates' holds the codes of shape (n_seeds, n_layers, 2 * n_wires). It is rewritten every save_every seeds, so an interrupted benchmark is resumed
+by running it again with the same file: seeds already in the table are skipped. Every
+row holds the settings it was computed with, and resuming with other settings raises a
+ValueError instead of mixing rows of different settings in one table.
+
+The spectrum and the overlap distribution are computed from states of all inputs at
+once with ``simulate()``. Training differentiates a PennyLane circuit in which the
+inputs of a batch are evaluated in one broadcasted execution, x being an array.
+
+Usage::
+
+    python benchmark.py results.npz --seeds 1000 --workers 64
+"""
+import argparse
+import inspect
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pennylane as qml
+from pennylane import numpy as np
+from two_wires_random_unitary_embeddings import random_gate_codes, random_embedding_circuit, simulate
+
+
+# Columns of the table with one value per seed
+COLUMNS = ('seed', 'n_wires', 'n_layers', 'n_steps', 'batch_size', 'stepsize', 'n_pairs', 'bins',
+           'gates', 'max_frequency', 'spectral_width', 'power', 'kl_haar', 'mean_overlap',
+           'init_cost', 'cost', 'tr_rr', 'tr_ss', 'tr_rs', 'pars', 'time')
+
+# Keyword arguments of ``evaluate_seed()`` that change the results, stored in every row
+SETTINGS = ('n_wires', 'n_layers', 'n_steps', 'batch_size', 'stepsize', 'n_pairs', 'bins')
+
+
+def gate_sequence(seed, n_wires=2, n_layers=2):
+    """Gate codes of the random gate sequence of a seed, drawn with np.random as in the notebook."""
+    np.random.seed(seed)
+    return random_gate_codes(n_wires, n_layers)
+
+
+def _states(codes, n_wires):
+    dev = qml.device('default.qubit', wires=n_wires)
+
+    @qml.qnode(dev)
+    def circuit(x, weights):
+        random_embedding_circuit(x, weights, range(n_wires), codes)
+        return qml.state()
+
+    return circuit
+
+
+def _paulis(n_wires):
+    return [qml.matrix(P(w), wire_order=range(n_wires))
+            for w in range(n_wires) for P in (qml.PauliX, qml.PauliY, qml.PauliZ)]
+
+
+def spectrum(codes, weights, tol=1e-10):
+    """
+    Computes the power of each frequency of the expectations of X, Y and Z on every wire.
+
+    The input enters through (n_layers + 1) * n_wires rotations, so the frequencies are
+    at most K = (n_layers + 1) * n_wires, and the coefficients follow from the discrete
+    Fourier transform of 2K+1 equidistant inputs.
+
+    :param codes: gate codes of shape (n_layers, 2 * n_wires)
+    :param weights: weights of shape (n_layers, n_wires)
+    :param tol: relative power below which a frequency counts as absent
+    :return: tuple of the power of the frequencies 0..K summed over the observables, the
+        largest present frequency, and the power-weighted root mean square frequency
+    """
+    n_layers, n_wires = len(codes), codes.shape[1] // 2
+    K = (n_layers + 1) * n_wires
+    x = 2 * np.pi * np.arange(2 * K + 1) / (2 * K + 1)
+    S = simulate(codes, x, weights)
+    values = np.array([np.real(np.einsum('ki,ij,kj->k', S.conj(), P, S)) for P in _paulis(n_wires)])
+    c = np.fft.fft(values, axis=-1) / (2 * K + 1)
+    # Power of +w and -w together
+    two_sided = np.sum(np.abs(c) ** 2, axis=0)
+    power = np.concatenate([two_sided[:1], two_sided[1:K + 1] + two_sided[:K:-1]])
+
+    frequencies = np.arange(K + 1)
+    present = power[1:] > tol * max(np.sum(power[1:]), 1e-300)
+    max_frequency = int(frequencies[1:][present].max()) if present.any() else 0
+    width = np.sqrt(np.sum(frequencies**2 * power) / np.sum(power))
+    return power, max_frequency, float(width)
+
+
+def expressibility(codes, n_pairs=1000, bins=75, rng=None):
+    """
+    Compares the distribution of the overlaps of random states of the circuit with the
+    Haar distribution P(F) = (d - 1) (1 - F)^(d - 2), d = 2^n_wires. Each state has a random
+    input in [-pi, pi] and random weights in [0, 2 pi).
+
+    :param codes: gate codes of shape (n_layers, 2 * n_wires)
+    :param n_pairs: number of pairs of random states
+    :param bins: number of histogram bins on [0, 1]
+    :param rng: seed or ``np.random.Generator``
+    :return: tuple of the KL divergence from the Haar distribution and the mean overlap
+    """
+    n_layers, n_wires = len(codes), codes.shape[1] // 2
+    rng = np.random.default_rng(rng)
+    x = rng.uniform(-np.pi, np.pi, size=2 * n_pairs)
+    weights = rng.uniform(0, 2 * np.pi, size=(2 * n_pairs, n_layers, n_wires))
+    S = simulate(codes, x, weights)
+    overlaps = np.abs(np.sum(S[:n_pairs].conj() * S[n_pairs:], axis=1)) ** 2
+
+    edges = np.linspace(0, 1, bins + 1)
+    p = np.histogram(overlaps, bins=edges)[0] / n_pairs
+    d = 2**n_wires
+    q = np.diff(1 - (1 - edges) ** (d - 1))
+    nonzero = p > 0
+    return float(np.sum(p[nonzero] * np.log(p[nonzero] / q[nonzero]))), float(np.mean(overlaps))
+
+
+def _overlaps(SA, SB):
+    return np.mean(np.abs(np.dot(np.conj(SA), SB.T)) ** 2)
+
+
+def _cost(states, weights, A, B):
+    SA, SB = states(A, weights), states(B, weights)
+    rr, ss, rs = _overlaps(SA, SA), _overlaps(SB, SB), _overlaps(SA, SB)
+    return 1 - (- rs + 0.5 * (ss + rr)), (rr, ss, rs)
+
+
+def train(states, A, B, n_wires, n_layers, n_steps=200, batch_size=2, stepsize=0.02, rng=None):
+    """
+    Trains the weights with the Hilbert-Schmidt cost like the notebook, from weights 0.001
+    with RMSProp, sampling batch_size inputs of each class per step.
+
+    :param states: function states(x, weights) returning the embedded states
+    :param A: array of inputs of class A
+    :param B: array of inputs of class B
+    :param n_wires: number of wires
+    :param n_layers: number of layers
+    :param n_steps: number of optimization steps
+    :param batch_size: number of inputs of each class per step
+    :param stepsize: learning rate of RMSProp
+    :param rng: seed or ``np.random.Generator`` for drawing the batches
+    :return: trained weights of shape (n_layers, n_wires)
+    """
+    rng = np.random.default_rng(rng)
+    optimizer = qml.RMSPropOptimizer(stepsize=stepsize)
+    pars = np.full((n_layers, n_wires), 0.001, requires_grad=True)
+    for _ in range(n_steps):
+        A_batch = np.array(A[rng.integers(len(A), size=batch_size)], requires_grad=False)
+        B_batch = np.array(B[rng.integers(len(B), size=batch_size)], requires_grad=False)
+        pars = optimizer.step(lambda w: _cost(states, w, A_batch, B_batch)[0], pars)
+    return pars
+
+
+_data = {}
+
+
+def _load_data(data_dir):
+    if data_dir not in _data:
+        X = np.loadtxt(os.path.join(data_dir, 'X_1d_sep.txt'), requires_grad=False)
+        Y = np.loadtxt(os.path.join(data_dir, 'Y_1d_sep.txt'), requires_grad=False)
+        _data[data_dir] = X[Y == -1], X[Y == 1]
+    return _data[data_dir]
+
+
+def evaluate_seed(seed, n_wires=2, n_layers=2, n_steps=200, batch_size=2, stepsize=0.02,
+                  n_pairs=1000, bins=75, data_dir='.'):
+    """
+    Computes the metrics of the random circuit of one seed.
+
+    :param seed: seed of the gate sequence, the overlap distribution and the batches
+    :param n_wires: number of wires
+    :param n_layers: number of layers
+    :param n_steps: number of optimization steps, 0 to skip training
+    :param batch_size: number of inputs of each class per step
+    :param stepsize: learning rate of RMSProp
+    :param n_pairs: number of pairs of random states for the overlap distribution
+    :param bins: number of histogram bins of the overlap distribution
+    :param data_dir: folder with X_1d_sep.txt and Y_1d_sep.txt
+    :return: dict with a value for every column of ``COLUMNS``
+    """
+    start = time.time()
+    codes = gate_sequence(seed, n_wires, n_layers)
+    states = _states(codes, n_wires)
+    rng = np.random.default_rng(seed)
+    A, B = _load_data(data_dir)
+
+    pars = np.full((n_layers, n_wires), 0.001, requires_grad=False)
+    init_cost, _ = _cost(states, pars, A, B)
+    if n_steps:
+        pars = train(states, A, B, n_wires, n_layers, n_steps=n_steps, batch_size=batch_size,
+                     stepsize=stepsize, rng=rng)
+    cost, (tr_rr, tr_ss, tr_rs) = _cost(states, np.array(pars, requires_grad=False), A, B)
+
+    power, max_frequency, width = spectrum(codes, np.array(pars))
+    kl_haar, mean_overlap = expressibility(codes, n_pairs=n_pairs, bins=bins, rng=rng)
+
+    return {'seed': seed,
+            'n_wires': n_wires,
+            'n_layers': n_layers,
+            'n_steps': n_steps,
+            'batch_size': batch_size,
+            'stepsize': stepsize,
+            'n_pairs': n_pairs,
+            'bins': bins,
+            'gates': codes,
+            'max_frequency': max_frequency,
+            'spectral_width': width,
+            'power': power,
+            'kl_haar': kl_haar,
+            'mean_overlap': mean_overlap,
+            'init_cost': float(init_cost),
+            'cost': float(cost),
+            'tr_rr': float(tr_rr),
+            'tr_ss': float(tr_ss),
+            'tr_rs': float(tr_rs),
+            'pars': np.array(pars),
+            'time': time.time() - start}
+
+
+def settings(**metrics):
+    """Settings of ``evaluate_seed()``, with the defaults filled in."""
+    defaults = inspect.signature(evaluate_seed).parameters
+    return {key: metrics.get(key, defaults[key].default) for key in SETTINGS}
+
+
+def load_results(path):
+    """
+    Reads a table written by ``run_benchmark()``.
+
+    :param path: .npz file
+    :return: dict of column name -> array with one entry per seed, empty if the file does not exist
+    """
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as table:
+        return {key: table[key] for key in table.files}
+
+
+def _save(path, rows):
+    table = {key: np.array([row[key] for row in rows]) for key in COLUMNS}
+    # Written to a temporary file first, so that an interruption never leaves a partial table
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, **table)
+    os.replace(tmp, path)
+
+
+def run_benchmark(path, seeds, n_wires=2, n_layers=2, n_workers=None, save_every=100, verbose=True,
+                  **metrics):
+    """
+    Evaluates the random circuits of many seeds and writes the results to a columnar table.
+
+    Seeds already in the table are skipped, so calling this again after an interruption
+    resumes the benchmark. If the table was computed with other settings, a ValueError
+    is raised.
+
+    :param path: .npz file of the table
+    :param seeds: iterable of seeds
+    :param n_wires: number of wires
+    :param n_layers: number of layers
+    :param n_workers: number of worker processes, defaults to the number of CPUs;
+        with 1 the seeds are evaluated in this process
+    :param save_every: number of evaluated seeds after which the table is rewritten
+    :param verbose: if True, print the progress
+    :param metrics: keyword arguments passed on to ``evaluate_seed()``
+    :return: dict of column name -> array, see ``load_results()``
+    """
+    config = settings(n_wires=n_wires, n_layers=n_layers, **metrics)
+    table = load_results(path)
+    if table:
+        missing = [key for key in SETTINGS if key not in table]
+        if missing:
+            raise ValueError("{} was written without the settings {}. Use another file."
+                             .format(path, ', '.join(missing)))
+        changed = [key for key in SETTINGS if np.any(table[key] != config[key])]
+        if changed:
+            raise ValueError("{} holds results computed with other {}. Use another file."
+                             .format(path, ', '.join(changed)))
+    rows = [{key: table[key][i] for key in COLUMNS} for i in range(len(table.get('seed', [])))]
+    done = {int(row['seed']) for row in rows}
+    pending = [seed for seed in seeds if seed not in done]
+    if verbose:
+        print("{} seeds done, {} to run".format(len(done), len(pending)))
+
+    def collect(row):
+        rows.append(row)
+        if len(rows) % save_every == 0:
+            _save(path, rows)
+        if verbose:
+            print("seed {} -- cost {:3f} -- KL {:3f} -- max frequency {}"
+                  .format(row['seed'], row['cost'], row['kl_haar'], row['max_frequency']))
+
+    kwargs = dict(metrics, **config)
+    if n_workers == 1:
+        for seed in pending:
+            collect(evaluate_seed(seed, **kwargs))
+    elif pending:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(evaluate_seed, seed, **kwargs) for seed in pending]
+            for future in as_completed(futures):
+                collect(future.result())
+
+    if rows:
+        rows.sort(key=lambda row: int(row['seed']))
+        _save(path, rows)
+    return load_results(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluate the expressivity of random embedding circuits.")
+    parser.add_argument('path', help="results table (.npz), resumed if it exists")
+    parser.add_argument('--seeds', type=int, default=1000, help="number of seeds, starting at --first-seed")
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--wires', type=int, default=2)
+    parser.add_argument('--layers', type=int, default=2)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=2)
+    parser.add_argument('--stepsize', type=float, default=0.02)
+    parser.add_argument('--pairs', type=int, default=1000)
+    args = parser.parse_args()
+
+    run_benchmark(args.path, range(args.first_seed, args.first_seed + args.seeds), n_wires=args.wires,
+                  n_layers=args.layers, n_workers=args.workers, n_steps=args.steps,
+                  batch_size=args.batch_size, stepsize=args.stepsize, n_pairs=args.pairs)
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+from benchmark import load_results, run_benchmark
+
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+QUICK = dict(n_workers=1, verbose=False, batch_size=1, stepsize=0.02, n_pairs=20, bins=10,
+             data_dir=DATA_DIR)
+
+
+def test_resume_skips_finished_seeds(tmp_path):
+    path = str(tmp_path / 'results.npz')
+    run_benchmark(path, [0], n_steps=1, **QUICK)
+    table = run_benchmark(path, [0, 1], n_steps=1, **QUICK)
+    assert list(table['seed']) == [0, 1]
+    assert set(table['n_steps']) == {1}
+
+
+@pytest.mark.parametrize('changed', [{'n_steps': 2}, {'stepsize': 0.1}, {'batch_size': 2},
+                                     {'n_pairs': 30}, {'bins': 5}])
+def test_resume_with_other_settings_raises(tmp_path, changed):
+    path = str(tmp_path / 'results.npz')
+    run_benchmark(path, [0], n_steps=1, **QUICK)
+    settings = dict(QUICK, n_steps=1)
+    settings.update(changed)
+    with pytest.raises(ValueError, match=next(iter(changed))):
+        run_benchmark(path, [1], **settings)
+    assert list(load_results(path)['seed']) == [0]
@@ -8,7 +8,7 @@ from pennylane import numpy as np
 
 def random_gate_sequence(num_wires,num_layers):
     
-    gate_set = [qml.RX, qml.RY, qml.RZ]
+    gate_set = GATES
     
     gate_sequence = []
     
@@ -19,11 +19,54 @@ def random_gate_sequence(num_wires,num_layers):
     return gate_sequence
 
 
+# Gate sequences can also be stored as a `uint8` array of shape (num_layers, 2$*$num_wires), where each entry is the index of the gate in `GATES`, 0 for RX, 1 for RY and 2 for RZ. Unlike lists of gate classes, these codes can be hashed, saved and sent to worker processes cheaply.
+# 
+# The function `random_gate_codes` draws the codes directly. With the same `np.random.seed` it returns the codes of the sequence of `random_gate_sequence`. A seeded `np.random.Generator` can be passed as **rng** instead. The functions `encode` and `decode` convert between both representations, and `dumps` and `loads` convert codes to a string like 'ZXZZ|XXZY' with one group of axes per layer and back.
+
+GATES = [qml.RX, qml.RY, qml.RZ]
+AXES = 'XYZ'
+
+
+def random_gate_codes(num_wires,num_layers,rng=None):
+    
+    if rng is None:
+        codes = np.random.randint(0,len(GATES),size=(num_layers,2*num_wires))
+    else:
+        codes = rng.integers(0,len(GATES),size=(num_layers,2*num_wires))
+    
+    return np.asarray(codes,dtype=np.uint8)
+
+
+def encode(gate_sequence):
+    
+    return np.array([[GATES.index(gate) for gate in gates_layer] for gates_layer in gate_sequence],dtype=np.uint8).reshape(len(gate_sequence),-1)
+
+
+def decode(codes):
+    
+    return [[GATES[c] for c in codes_layer] for codes_layer in np.asarray(codes)]
+
+
+def dumps(codes):
+    
+    return '|'.join(''.join(AXES[c] for c in codes_layer) for codes_layer in np.asarray(codes))
+
+
+def loads(string):
+    
+    if not string:
+        return np.zeros((0,0),dtype=np.uint8)
+    layers = string.split('|')
+    if len({len(l) for l in layers}) != 1 or any(a not in AXES for l in layers for a in l):
+        raise ValueError("{} is not a valid gate sequence.".format(string))
+    return np.array([[AXES.index(a) for a in l] for l in layers],dtype=np.uint8)
+
+
 # The function `random_embedding_circuit` generates a variational circuit that embeds the data $x$ into a quantum state $|x>$. This circuit will act of $N$ wires and it will consist of $L$ layers. In addition to the data input $x$, this function will take the following inputs:
 # 
 # 1. **weights**: an array of shape $(L,N)$. 
 # 2. **wires**: a list of size $N$. This will determine which wires the circuit acts on.
-# 3. **gate_sequence**: an array of shape $(L,2N)$. This will determine what gates are part of the embedding circuit.
+# 3. **gate_sequence**: an array of shape $(L,2N)$. This will determine what gates are part of the embedding circuit. It can be a list of gate classes or an array of gate codes.
 # 
 # Note that each layer will consists of a random Pauli rotation by amount $x$ on each wire followed by a controlled-Z gate between wires $i$ and $i+1$ for $i = \{1,2,...,N-1\}$ followed by another round of random Pauli rotations by amount $\theta \in $ **weights**. In addition to $L$ layers of this form, the circuit will start off with a $RY(\pi/4)$ acting on each wire and it will end with a $RX(x)$ acting on each wire. This circuit is inspired by [Mclean et al; 2018](https://arxiv.org/pdf/1803.11173.pdf).
 
@@ -33,6 +76,9 @@ def random_embedding_circuit(x,weights,wires,gate_sequence):
     
     no_qubits = len(wires)
     
+    if isinstance(gate_sequence, np.ndarray):
+        gate_sequence = decode(gate_sequence)
+    
     for w in wires:
         qml.RY(np.pi/4,wires=w)
         
@@ -53,4 +99,73 @@ def random_embedding_circuit(x,weights,wires,gate_sequence):
         qml.RX(x,wires=w)
 
 
+# The function `simulate` computes the states of `random_embedding_circuit` with numpy for a batch of inputs, without building a circuit. It takes the gate codes, an array **x** of $M$ inputs and the **weights** of shape $(L,N)$, or $(M,L,N)$ for one set of weights per input, and returns the states of shape $(M,2^N)$ in the wire order of PennyLane. Each rotation is applied to all inputs at once as a batch of $2\times 2$ matrices, and each round of controlled-Z gates is a multiplication with a diagonal of signs.
 
+def _rotations(code,theta):
+    
+    c = np.cos(theta/2)
+    s = np.sin(theta/2)
+    z = np.zeros_like(c)
+    if code == 0:
+        m = [[c, -1j*s], [-1j*s, c]]
+    elif code == 1:
+        m = [[c, -s], [s, c]]
+    else:
+        m = [[c - 1j*s, z], [z, c + 1j*s]]
+    return np.moveaxis(np.array(m,dtype=complex),-1,0)
+
+
+def _apply(state,matrices,wire):
+    
+    shape = state.shape
+    state = state.reshape(shape[0],2**wire,2,-1)
+    return np.einsum('mab,mibj->miaj',matrices,state).reshape(shape)
+
+
+def _cz_signs(no_qubits):
+    
+    bits = (np.arange(2**no_qubits)[:,None] >> np.arange(no_qubits-1,-1,-1)) & 1
+    return (-1.0)**np.sum(bits[:,:-1]*bits[:,1:],axis=1)
+
+
+def simulate(codes,x,weights):
+    
+    codes = np.asarray(codes)
+    x = np.asarray(x,dtype=float).reshape(-1)
+    weights = np.asarray(weights,dtype=float)
+    no_inputs = len(x)
+    no_qubits = codes.shape[1]//2
+    if weights.ndim == 2:
+        weights = np.broadcast_to(weights,(no_inputs,)+weights.shape)
+    if weights.shape[1:] != (len(codes),no_qubits):
+        raise ValueError("Weights of shape {} do not fit gate codes of shape {}.".format(weights.shape,codes.shape))
+    signs = _cz_signs(no_qubits)
+    
+    state = np.zeros((no_inputs,2**no_qubits),dtype=complex)
+    state[:,0] = 1
+    for w in range(no_qubits):
+        state = _apply(state,_rotations(1,np.full(no_inputs,np.pi/4)),w)
+    
+    for l, codes_layer in enumerate(codes):
+        for i in range(no_qubits):
+            state = _apply(state,_rotations(codes_layer[i],x),i)
+        state = state*signs
+        for i in range(no_qubits):
+            state = _apply(state,_rotations(codes_layer[no_qubits+i],weights[:,l,i]),i)
+        state = state*signs
+    
+    for w in range(no_qubits):
+        state = _apply(state,_rotations(0,x),w)
+    
+    return state
+
+
+# The function `simulate_batch` computes the states for $P$ sets of weights and $M$ inputs in one pass of `simulate`. It takes **weights** of shape $(P,L,N)$ and returns the states of shape $(P,M,2^N)$, where `simulate_batch(codes,x,weights)[p]` equals `simulate(codes,x,weights[p])`.
+
+def simulate_batch(codes,x,weights):
+    
+    x = np.asarray(x,dtype=float).reshape(-1)
+    weights = np.asarray(weights,dtype=float)
+    no_sets = len(weights)
+    states = simulate(codes,np.tile(x,no_sets),np.repeat(weights,len(x),axis=0))
+    return states.reshape(no_sets,len(x),-1)
@@ -1,6 +1,13 @@
+import os
+import sys
+import numpy
 import pennylane as qml
 from pennylane import numpy as np
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                             'Simulation_of_Variational_Circuits'))
+import generators
+
 
 # This function generates a 2-dimensional data set.
 # The argument 'size' determines the number of 
@@ -9,31 +16,16 @@ from pennylane import numpy as np
 # the data points of different classes.
 # For i = 1,2, we transform the x_i to x_i + margin * sign(x_i).
 
-def generate_data(size,margin):
-    X = []
-    Y = []
-    for i in range(size):
-        x1 = 2.0*np.random.random() - 1.0
-        x2 = 2.0*np.random.random() - 1.0
-        y = x1*x2
-        
-                
-        if x1 < 0:
-            x1 = x1 - margin
-        else:
-            x1 = x1 + margin
-        if x2 < 0:
-            x2 = x2 - margin
-        else:
-            x2 = x2 + margin
-        
-        X.append([x1,x2])
-        if y>0:
-            Y.append(1)
-        else: 
-            Y.append(-1)
-            
-    return X, Y
+# The points are drawn by generators.xor in Simulation_of_Variational_Circuits;
+# with the same np.random.seed the data set is the same as when the points were
+# drawn one by one. A seeded np.random.Generator can be passed as 'rng' instead.
+
+def generate_data(size,margin,rng=None):
+    if rng is None:
+        rng = numpy.random.mtrand._rand  # global state of np.random
+    X, Y = generators.xor(size, dim=2, margin=margin, rng=rng)
+
+    return np.array(X), Y.astype(int)
 
 
 
@@ -0,0 +1,198 @@
+"""
+Risk
+====
+
+Empirical and smooth risk of the fidelity classifier of ``risk_function.ipynb``.
+
+``embedding_states()`` returns the single-qubit states of ``embedding_circuit()`` for a batch of inputs
+``gram()`` returns the fidelities |<phi(x1)|phi(x2)>|^2 of all pairs of training inputs
+``risk()`` returns the empirical 0/1 risk
+``smooth_risk()`` returns the risk with sign(overlap_B - overlap_A) replaced by tanh
+``smooth_risk_and_grad()`` returns the smooth risk and its gradient with respect to the weights
+
+As in the notebook, A are the inputs labeled by -1, B the inputs labeled by 1, and the
+classifier returns sign(overlap_B - overlap_A), with the mean overlaps of an input with
+the classes. The notebook runs one SWAP test for every pair of training inputs and every
+evaluation of the classifier. Here all overlaps are read off one Gram matrix, so that the
+risk of all training inputs costs one embedding per input.
+
+``embedding_circuit()`` applies only single-qubit gates, so its state is a product state
+and the fidelity of two inputs is the product of the fidelities of each qubit. The
+gradient of the smooth risk follows from the derivatives of the single-qubit states.
+
+With leave_one_out=True, every training input is left out of the mean overlap with its
+own class, which otherwise contains its overlap of 1 with itself.
+
+``embedding_states()`` and ``gram()`` also take weights with a leading axis of P sets,
+and return the results of all sets of weights from one vectorized pass.
+"""
+import numpy as np
+
+
+def _rx(theta):
+    c, s = np.cos(theta / 2), np.sin(theta / 2)
+    return np.moveaxis(np.array([[c, -1j * s], [-1j * s, c]]), (0, 1), (-2, -1))
+
+
+def _ry(theta):
+    c, s = np.cos(theta / 2), np.sin(theta / 2)
+    return np.moveaxis(np.array([[c, -s], [s, c]], dtype=complex), (0, 1), (-2, -1))
+
+
+# Generator of RY, d/dtheta RY(theta) = -i/2 Y RY(theta)
+_DRY = -0.5j * np.array([[0, -1j], [1j, 0]])
+
+
+def _run(X, weights, derivative=None):
+    """
+    Simulates ``embedding_circuit()`` on every qubit for all inputs. If derivative is a
+    layer l, the derivative of each qubit's state with respect to its weight in layer l
+    is returned instead.
+    """
+    X = np.asarray(X, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    batched = weights.ndim == 3
+    if not batched:
+        weights = weights[None]
+    n_sets, n_layers, n_qubits = weights.shape
+
+    states = np.zeros((n_sets, len(X), n_qubits, 2), dtype=complex)
+    states[..., 0] = 1
+    for l in range(n_layers):
+        states = np.einsum('nab,pnqb->pnqa', _rx(X[:, l % 2]), states)
+        states = np.einsum('pqab,pnqb->pnqa', _ry(weights[:, l]), states)
+        if l == derivative:
+            states = states @ _DRY.T
+
+    xp = X[:, 0] * X[:, 1] if n_layers % 2 == 0 else X[:, 1]
+    states = np.einsum('nab,pnqb->pnqa', _rx(xp), states)
+    return states if batched else states[0]
+
+
+def embedding_states(X, weights):
+    """
+    Computes the state of every qubit after ``embedding_circuit()``.
+
+    :param X: array of inputs of shape (N, 2)
+    :param weights: array of weights of shape (n_layers, n_qubits), or (P, n_layers, n_qubits)
+    :return: array of shape (N, n_qubits, 2), or (P, N, n_qubits, 2)
+    """
+    return _run(X, weights)
+
+
+def _qubit_overlaps(states):
+    """Overlaps <phi_i(x1)|phi_i(x2)> of every qubit i, of shape (..., n_qubits, N, N)."""
+    return np.einsum('...nqa,...mqa->...qnm', states.conj(), states)
+
+
+def gram(X, weights):
+    """
+    Computes the fidelities |<phi(x1)|phi(x2)>|^2 of all pairs of inputs.
+
+    :param X: array of inputs of shape (N, 2)
+    :param weights: array of weights of shape (n_layers, n_qubits), or (P, n_layers, n_qubits)
+    :return: array of shape (N, N), or (P, N, N)
+    """
+    return np.prod(np.abs(_qubit_overlaps(embedding_states(X, weights))) ** 2, axis=-3)
+
+
+def _dataset(A, B):
+    A = np.asarray(A, dtype=float).reshape(len(A), -1)
+    B = np.asarray(B, dtype=float).reshape(len(B), -1)
+    if len(A) == 0 or len(B) == 0:
+        raise ValueError("Both classes need at least one input.")
+    return np.concatenate([A, B]), np.concatenate([-np.ones(len(A)), np.ones(len(B))])
+
+
+def _coefficients(y, leave_one_out):
+    """
+    Matrix C such that (C * gram).sum(axis=1) is overlap_B - overlap_A of every input.
+    """
+    n_A, n_B = np.sum(y == -1), np.sum(y == 1)
+    sizes = np.where(y == 1, n_B, n_A).astype(float)
+    if leave_one_out:
+        same = y[:, None] == y[None, :]
+        sizes = np.where(same, sizes[None, :] - 1, sizes[None, :])
+        if np.any(sizes == 0):
+            raise ValueError("Leaving one out needs at least two inputs per class.")
+        C = y[None, :] / sizes
+        np.fill_diagonal(C, 0)
+        return C
+    return np.broadcast_to(y / sizes, (len(y), len(y)))
+
+
+def _differences(G, y, leave_one_out):
+    return np.sum(_coefficients(y, leave_one_out) * G, axis=1)
+
+
+def risk(weights, A=None, B=None, leave_one_out=False):
+    """
+    Computes the empirical risk, the fraction of misclassified training inputs,
+    0.5 - 0.5 * mean(y * classifier(x)).
+
+    :param weights: array of weights of shape (n_layers, n_qubits)
+    :param A: array of inputs labeled by -1
+    :param B: array of inputs labeled by 1
+    :param leave_one_out: if True, leave every input out of the overlap with its class
+    :return: risk between 0 and 1
+    """
+    X, y = _dataset(A, B)
+    d = _differences(gram(X, weights), y, leave_one_out)
+    return 0.5 - 0.5 * np.mean(y * np.sign(d))
+
+
+def smooth_risk(weights, A=None, B=None, scale=None, leave_one_out=False):
+    """
+    Computes the risk with the classifier tanh(scale * (overlap_B - overlap_A)).
+
+    :param weights: array of weights of shape (n_layers, n_qubits)
+    :param A: array of inputs labeled by -1
+    :param B: array of inputs labeled by 1
+    :param scale: steepness of tanh, len(A) as in the notebook if None
+    :param leave_one_out: if True, leave every input out of the overlap with its class
+    :return: smooth risk between 0 and 1
+    """
+    scale = len(A) if scale is None else scale
+    X, y = _dataset(A, B)
+    d = _differences(gram(X, weights), y, leave_one_out)
+    return 0.5 - 0.5 * np.mean(y * np.tanh(scale * d))
+
+
+def smooth_risk_and_grad(weights, A=None, B=None, scale=None, leave_one_out=False):
+    """
+    Computes the smooth risk and its gradient with respect to the weights.
+
+    :param weights: array of weights of shape (n_layers, n_qubits)
+    :param A: array of inputs labeled by -1
+    :param B: array of inputs labeled by 1
+    :param scale: steepness of tanh, len(A) as in the notebook if None
+    :param leave_one_out: if True, leave every input out of the overlap with its class
+    :return: tuple of the smooth risk and the gradient of shape (n_layers, n_qubits)
+    """
+    scale = len(A) if scale is None else scale
+    weights = np.asarray(weights, dtype=float)
+    X, y = _dataset(A, B)
+    C = _coefficients(y, leave_one_out)
+
+    states = embedding_states(X, weights)
+    overlaps = _qubit_overlaps(states)
+    fidelities = np.abs(overlaps) ** 2
+    G = np.prod(fidelities, axis=0)
+    t = np.tanh(scale * np.sum(C * G, axis=1))
+    value = 0.5 - 0.5 * np.mean(y * t)
+
+    # Adjoint of the Gram matrix, dR/dG
+    adjoint = (-0.5 / len(y) * scale * y * (1 - t**2))[:, None] * C
+
+    n_layers, n_qubits = weights.shape
+    # Adjoint times the product of the fidelities of all other qubits, for every qubit
+    weighted = [adjoint * np.prod(np.delete(fidelities, i, axis=0), axis=0) for i in range(n_qubits)]
+    grad = np.zeros((n_layers, n_qubits))
+    for l in range(n_layers):
+        d_states = _run(X, weights, derivative=l)
+        for i in range(n_qubits):
+            # <d phi_i(x1)|phi_i(x2)> for all pairs
+            D = d_states[:, i].conj() @ states[:, i].T
+            d_fidelities = 2 * np.real(overlaps[i].conj() * (D + D.conj().T))
+            grad[l, i] = np.sum(weighted[i] * d_fidelities)
+    return value, grad